@@ -0,0 +1,66 @@
+"""
+Compare streamed and multithreaded memory-mapped blake3 hashing of large files.
+
+    python -m dev.bench_blake3 --size 4096 --threads 1 2 4 8
+
+Creates a random file of `--size` MB (or uses `--file`) and reports throughput of the streamed
+Instance-Code hashing (as done by iscc-core) and of multithreaded hashing over a memory mapping
+for each thread count (-1 = all cores).
+"""
+import argparse
+import mmap
+import os
+import tempfile
+import time
+from blake3 import blake3
+import iscc_core as ic
+
+
+def streamed(fp):
+    # type: (str) -> str
+    with open(fp, "rb") as stream:
+        return ic.gen_instance_code_v0(stream)["datahash"]
+
+
+def mapped(fp, threads):
+    # type: (str, int) -> str
+    hasher = blake3(max_threads=threads)
+    with open(fp, "rb") as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                hasher.update(view)
+    return "1e20" + hasher.hexdigest()
+
+
+def measure(label, func, size):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {size / elapsed / 1000000:>10.1f} MB/s")
+    return result
+
+
+def bench(fp, threads):
+    # type: (str, list) -> None
+    size = os.path.getsize(fp)
+    print(f"file: {fp} ({size / 1000000:.0f} MB), cores: {os.cpu_count()}")
+    expected = measure("streamed", lambda: streamed(fp), size)
+    for num in threads:
+        result = measure(f"mmap {num} threads", lambda: mapped(fp, num), size)
+        assert result == expected, "hash mismatch"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--file", help="File to hash (default: create random file)")
+    parser.add_argument("--size", type=int, default=2048, help="Size of random file in MB")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, blake3.AUTO])
+    args = parser.parse_args()
+    if args.file:
+        bench(args.file, args.threads)
+    else:
+        with tempfile.NamedTemporaryFile() as tmp:
+            for _ in range(args.size):
+                tmp.write(os.urandom(1000000))
+            tmp.flush()
+            bench(tmp.name, args.threads)
@@ -0,0 +1,53 @@
+"""
+Measure requests per second for concurrent media uploads against a running service.
+
+Compare serialized and pooled database access from async views by starting the service with
+each setting and running this benchmark against it:
+
+    ASYNC_DB_THREAD_SENSITIVE=true uvicorn iscc_service_generator.asgi:application
+    python -m dev.bench_uploads path/to/file.jpg --concurrency 16 --requests 200
+
+    ASYNC_DB_THREAD_SENSITIVE=false uvicorn iscc_service_generator.asgi:application
+    python -m dev.bench_uploads path/to/file.jpg --concurrency 16 --requests 200
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename
+import requests
+
+
+def upload(url, filename, data):
+    # type: (str, str, bytes) -> float
+    """Upload a file and return the request latency in seconds."""
+    start = time.perf_counter()
+    response = requests.post(url, files={"source_file": (filename, data)})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def bench(url, fp, concurrency, total):
+    # type: (str, str, int, int) -> None
+    with open(fp, "rb") as infile:
+        data = infile.read()
+    filename = basename(fp)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda _: upload(url, filename, data), range(total)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(f"uploads:     {total} x {len(data)} bytes ({concurrency} concurrent)")
+    print(f"throughput:  {total / elapsed:.2f} req/s")
+    print(f"latency p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p95: {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("file", help="File to upload")
+    parser.add_argument("--url", default="http://localhost:8000/api/media")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    bench(args.url, args.file, args.concurrency, args.requests)
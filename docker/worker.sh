@@ -1,3 +1,8 @@
 #!/usr/bin/env sh
 
+# Start a worker for the processing lane given as argument or in WORKER_LANE (default queue if unset)
+LANE="${1:-$WORKER_LANE}"
+if [ -n "$LANE" ]; then
+  exec python manage.py qlane "$LANE"
+fi
 exec python manage.py qcluster
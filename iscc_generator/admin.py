@@ -4,8 +4,8 @@ from django import forms
 from django.db import models
 from django_json_widget.widgets import JSONEditorWidget
 from django_object_actions import DjangoObjectActions, takes_instance_or_queryset
-from django_q.tasks import async_task
-from iscc_generator.models import IsccCode, Media, Nft
+from iscc_generator.models import CacheStats, IsccBatch, IsccCode, Media, Nft, ResultCache
+from iscc_generator.pipeline import start_pipeline
 from iscc_generator.tasks import iscc_generator_task
 
 
@@ -47,11 +47,22 @@ class MediaAdmin(admin.ModelAdmin):
         "name",
         "source_file",
         "cid",
+        "cid_wrapped",
+        "datahash",
         "type",
         "filesize",
         "metadata",
     )
-    readonly_fields = ("flake", "original_flake", "name", "cid", "type", "filesize")
+    readonly_fields = (
+        "flake",
+        "original_flake",
+        "name",
+        "cid",
+        "cid_wrapped",
+        "datahash",
+        "type",
+        "filesize",
+    )
     search_fields = ("source_file",)
     list_filter = ("type",)
 
@@ -86,10 +97,11 @@ class IsccCodeAdmin(DjangoObjectActions, admin.ModelAdmin):
         "name",
     )
 
-    list_filter = ("source_file__type",)
-    readonly_fields = ("iscc",)
+    list_filter = ("source_file__type", "stage")
+    readonly_fields = ("iscc", "stage")
     fields = (
         "iscc",
+        "stage",
         "source_file",
         "source_url",
         "name",
@@ -132,7 +144,46 @@ class IsccCodeAdmin(DjangoObjectActions, admin.ModelAdmin):
     @takes_instance_or_queryset
     def action_create_iscc(self, request, queryset):
         for obj in queryset:
-            async_task(iscc_generator_task, obj.pk)
+            start_pipeline(obj)
 
     action_create_iscc.label = "Generate ISCC"  # optional
     action_create_iscc.short_description = "Generate ISCC Codes for selected entries"
+
+
+@admin.register(IsccBatch)
+class IsccBatchAdmin(admin.ModelAdmin):
+    list_display = ("flake", "item_count", "created")
+
+    @admin.display(description="items")
+    def item_count(self, obj):
+        return obj.items.count()
+
+
+@admin.register(ResultCache)
+class ResultCacheAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "datahash", "version", "hits", "created", "accessed")
+    readonly_fields = ("datahash", "metahash", "version", "media", "result", "hits", "accessed")
+    search_fields = ("datahash",)
+    list_filter = ("version",)
+    actions = ["action_invalidate"]
+
+    formfield_overrides = {
+        models.JSONField: {
+            "widget": JSONEditorWidget(width="53em", height="28em", options={"mode": "view"})
+        },
+    }
+
+    @admin.action(description="Invalidate selected cache entries")
+    def action_invalidate(self, request, queryset):
+        queryset.delete()
+
+
+@admin.register(CacheStats)
+class CacheStatsAdmin(admin.ModelAdmin):
+    list_display = ("name", "hits", "misses", "ratio")
+    readonly_fields = ("name", "hits", "misses", "ratio")
+    actions = ["action_reset"]
+
+    @admin.action(description="Reset selected statistics")
+    def action_reset(self, request, queryset):
+        queryset.update(hits=0, misses=0)
@@ -1,25 +1,33 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import base64
 import io
 import json
-import os
 from datetime import datetime
-from os.path import join, basename
-from tempfile import TemporaryDirectory
-from typing import Optional
-from asgiref.sync import sync_to_async
+from typing import Any, List, Optional
 from data_url import DataURL
 from django.shortcuts import redirect
-from django_q.tasks import async_task, result
 from django_q.models import Task, OrmQ
-from iscc_generator.schema import NftPackage, QueuedTasks
+from iscc_generator.schema import (
+    CacheStatsSchema,
+    IsccBatchItem,
+    IsccBatchPostRequest,
+    IsccBatchResponse,
+    NftPackage,
+    QueuedTasks,
+)
 from ninja import Router, File, Form, Schema, UploadedFile
-from iscc_generator.base import get_or_404
+from iscc_generator.base import db_sync_to_async, get_or_404
 from iscc_generator.codegen.spec import IsccCodePostRequest
-from iscc_generator.models import IsccCode, Media, Nft
+from iscc_generator.download import download_media
+from iscc_generator.notify import task_result as async_task_result, wait_for_task
+from iscc_generator.models import CacheStats, IsccBatch, IsccCode, Media, Nft
 from iscc_generator.schema import AnyObject
-from iscc_generator.storage import media_obj_from_path
-from iscc_generator.tasks import iscc_generator_task, nft_generator_task
+from iscc_generator.queues import enqueue_task, find_queued_task, media_lane, queue_depths
+from iscc_generator import facts, inline
+from iscc_generator.pipeline import start_pipeline
+from iscc_generator.storage import derived_media_obj_from_path, remove_local_temp
+from iscc_generator.tasks import nft_generator_task
 from iscc_generator.utils import normalize_web3_address
 from iscc_generator.codegen.spec import (
     NftPostRequest,
@@ -28,7 +36,6 @@ from iscc_generator.codegen.spec import (
     MediaID,
 )
 from constance import config
-import iscc_sdk as idk
 import iscc_core as ic
 import iscc_schema as iss
 
@@ -48,6 +55,7 @@ class TaskResponse(Schema):
     success: Optional[bool]
     attempt_count: Optional[int]
     result: Optional[dict]
+    queue_position: Optional[int]
 
 
 @router.post(
@@ -80,36 +88,33 @@ async def iscc_code_create(
     # validate the request
     if not source_file and not meta.source_url:
         return 400, Message(detail="Either source_file or source_url is required")
-    if meta.meta:
-        if meta.meta.startswith("data:"):
-            try:
-                DataURL.from_url(meta.meta)
-            except Exception:
-                return 500, Message(detail="Invalid Data-URL in field meta")
-        else:
-            try:
-                json.loads(meta.meta)
-            except Exception:
-                return 500, Message(detail="Invalid JSON-string in field meta")
+    error = validate_meta(meta.meta)
+    if error:
+        return 500, Message(detail=error)
 
     media_obj = None
     # Create Media object if source_file provided (source_url will be handled by worker task).
     if source_file:
         try:
-            media_obj = await sync_to_async(Media.objects.create)(source_file=source_file)
+            media_obj = await db_sync_to_async(Media.objects.create)(source_file=source_file)
         except Exception as e:
             return 500, Message(detail=str(e))
 
     # create IsccCode object
-    iscc_obj = await sync_to_async(IsccCode.objects.create)(source_file=media_obj, **meta.dict())
+    iscc_obj = await db_sync_to_async(IsccCode.objects.create)(source_file=media_obj, **meta.dict())
+
+    # process tiny uploads without the task queue
+    if await inline.generate(iscc_obj, media_obj):
+        iscc_obj = await db_sync_to_async(IsccCode.objects.get)(pk=iscc_obj.pk)
+        return 201, iscc_obj.result
 
     # start processing
-    task_id = await sync_to_async(async_task)(iscc_generator_task, iscc_obj.pk)
+    task_id = await db_sync_to_async(start_pipeline)(iscc_obj)
 
     # wait for result with timeout
     task_result = await async_wait_for_task(task_id)
     if task_result:
-        iscc_obj = await sync_to_async(IsccCode.objects.get)(pk=iscc_obj.pk)
+        iscc_obj = await db_sync_to_async(IsccCode.objects.get)(pk=iscc_obj.pk)
         return 201, iscc_obj.result
     # return task-id instead
     else:
@@ -119,6 +124,71 @@ async def iscc_code_create(
         return 202, task
 
 
+@router.post(
+    "/iscc_code/batch",
+    response={202: IsccBatchResponse, 400: Message, 500: Message},
+    summary="create iscc batch",
+    tags=["iscc"],
+    operation_id="iscc-code-batch-create",
+    exclude_none=True,
+)
+async def iscc_code_batch_create(
+    request,
+    source_files: List[UploadedFile] = File(
+        None, description="The files used for generating the ISCCs"
+    ),
+    meta: IsccBatchPostRequest = Form(...),
+):
+    """
+    ## Generate ISCCs for many media assets.
+
+    Provide any number of `source_files` and/or `source_urls` up to the configured batch size
+    limit. All items are queued at once and processed in parallel by the available workers.
+    Poll for per-item status and results at /iscc_code/batch/{batch_id}.
+
+    Metadata supplied with the request will be embedded into each of the media assets
+    (if possible).
+    """
+    # validate the request
+    source_files = source_files or []
+    count = len(source_files) + len(meta.source_urls)
+    if not count:
+        return 400, Message(detail="Either source_files or source_urls are required")
+    limit = await async_get_config("BATCH_SIZE_LIMIT")
+    if count > limit:
+        return 400, Message(detail=f"Batch size limit of {limit} exceeded")
+    error = validate_meta(meta.meta)
+    if error:
+        return 500, Message(detail=error)
+
+    media_objs = []
+    for source_file in source_files:
+        try:
+            media_objs.append(await db_sync_to_async(Media.objects.create)(source_file=source_file))
+        except Exception as e:
+            return 500, Message(detail=str(e))
+
+    # create and enqueue batch items
+    batch = await async_create_batch(media_objs, meta)
+    return 202, await async_batch_status(batch)
+
+
+@router.get(
+    "/iscc_code/batch/{batch_id}",
+    response={200: IsccBatchResponse, 404: Message},
+    summary="get iscc batch",
+    tags=["iscc"],
+    operation_id="iscc-code-batch-get",
+    exclude_none=True,
+)
+async def iscc_code_batch_get(request, batch_id: str):
+    """
+    Get processing status and results for the items of a batch.
+    """
+    batch: IsccBatch = await get_or_404(IsccBatch, batch_id)
+    return await async_batch_status(batch)
+
+
 @router.get(
     "/iscc_code/{iscc}",
     response={200: iss.IsccMeta, 404: Message},
@@ -134,7 +204,7 @@ async def iscc_code_get(request, iscc: str):
     """
     try:
         iscc = ic.iscc_normalize(iscc)
-        objs = await sync_to_async(list)(IsccCode.objects.filter(iscc=iscc))
+        objs = await db_sync_to_async(list)(IsccCode.objects.filter(iscc=iscc))
         return objs[0].result
     except Exception:
         return 404, Message(detail="ISCC-CODE not found")
@@ -153,8 +223,8 @@ async def iscc_code_delete(request, iscc: str):
     """
     try:
         iscc = ic.iscc_normalize(iscc)
-        iscc_code_obj: IsccCode = await sync_to_async(IsccCode.objects.get)(iscc=iscc)
-        await sync_to_async(iscc_code_obj.delete)()
+        iscc_code_obj: IsccCode = await db_sync_to_async(IsccCode.objects.get)(iscc=iscc)
+        await db_sync_to_async(iscc_code_obj.delete)()
         return 200, Message(detail="ISCC-CODE deleted")
     except Exception:
         return 404, Message(detail="ISCC-CODE not found")
@@ -178,7 +248,7 @@ async def media_post(request, source_file: UploadedFile = File(None)):
         return 400, Message(detail="No file sent")
 
     try:
-        media_obj = await sync_to_async(Media.objects.create)(source_file=source_file)
+        media_obj = await db_sync_to_async(Media.objects.create)(source_file=source_file)
     except Exception as e:
         return 500, Message(detail=e.__class__.__name__)
     return 201, MediaID(media_id=media_obj.flake)
@@ -205,7 +275,7 @@ async def media_get(request, media_id):
 async def media_delete(request, media_id: str):
     """Delete media asset"""
     media_obj: Media = await get_or_404(Media, media_id)
-    await sync_to_async(media_obj.delete)()
+    await db_sync_to_async(media_obj.delete)()
 
     return 200, Message(detail="Media asset deleted")
 
@@ -227,7 +297,7 @@ async def media_metadata_embed(request, media_id: str, meta: MediaEmbeddedMetada
     return 201, MediaID(media_id=new_media_obj.flake)
 
 
-@sync_to_async
+@db_sync_to_async
 def async_media_metadata_embed(media_obj: Media, meta: MediaEmbeddedMetadata):
     """
     Embed metadata into a media file.
@@ -235,22 +305,16 @@ def async_media_metadata_embed(media_obj: Media, meta: MediaEmbeddedMetadata):
     # TODO - we need to download/reupload the file - move this to a worker task
     """
     meta = iss.IsccMeta.parse_obj(meta.dict())
-    # Copy file to local storage
-    filename = basename(media_obj.source_file.name)
-    with TemporaryDirectory() as tempdir:
-        tmpfile_path = join(tempdir, filename)
-        with open(tmpfile_path, "wb") as tmpfile:
-            with media_obj.source_file.open("rb") as infile:
-                data = infile.read(1024 * 1024)
-                while data:
-                    tmpfile.write(data)
-                    data = infile.read(1024 * 1024)
-        # Embed metadata
-        new_file = idk.embed_metadata(tmpfile_path, meta=meta)
-
-    # Create new media object
-    new_media_object = media_obj_from_path(new_file, original=media_obj)
-    os.remove(new_file)
+    tmpfile_path = download_media(media_obj)
+    try:
+        with facts.scope():
+            # Embed metadata (into a copy of the file)
+            new_file = facts.embed_metadata(tmpfile_path, meta=meta)
+            # Create new media object
+            new_media_object = derived_media_obj_from_path(new_file, media_obj, tmpfile_path, meta)
+        remove_local_temp(new_file)
+    finally:
+        remove_local_temp(tmpfile_path)
 
     return new_media_object
 
@@ -259,13 +323,33 @@ def async_media_metadata_embed(media_obj: Media, meta: MediaEmbeddedMetadata):
     "media/metadata/{media_id}",
     tags=["media"],
     operation_id="get-media-metadata",
-    response={200: MediaEmbeddedMetadata, 400: None, 404: None},
+    response={200: MediaEmbeddedMetadata, 202: TaskResponse, 400: None, 404: None, 503: Message},
     exclude_none=True,
     summary="extract metadata",
 )
 async def media_metadata_get(request, media_id: str):
-    """Reads and returns embedded metadata from the media asset."""
+    """
+    Reads and returns embedded metadata from the media asset.
+
+    If metadata extraction is still pending it is awaited (or started if required). If extraction
+    exeeds the configured time limit you will receive a `TaskResponse`.
+    """
     media_obj: Media = await get_or_404(Media, media_id)
+    if media_obj.metadata is None:
+        task_id = media_obj.metadata_task
+        done = False
+        if task_id:
+            done, _ = await async_task_result(task_id)
+        if not task_id or done:
+            # never started or finished without result
+            task_id = await db_sync_to_async(Media.enqueue_metadata_task)(media_obj.pk)
+        await async_wait_for_task(task_id)
+        await db_sync_to_async(media_obj.refresh_from_db)()
+        if media_obj.metadata is None:
+            task = await async_find_task(task_id)
+            if not task:
+                return 503, Message(detail="Task not found")
+            return 202, task
     return media_obj.metadata
 
 
@@ -301,17 +385,18 @@ async def nft_post(request, item: NftPostRequest):
     else:
         media_obj_animation = None
     data = item.dict(exclude={"media_id_image", "media_id_animation"})
-    nft_obj = await sync_to_async(Nft.objects.create)(
+    nft_obj = await db_sync_to_async(Nft.objects.create)(
         media_id_image=media_obj_image, media_id_animation=media_obj_animation, **data
     )
 
     # start processing
-    task_id = await sync_to_async(async_task)(nft_generator_task, nft_obj.pk)
+    lane = media_lane(media_obj_animation or media_obj_image)
+    task_id = await db_sync_to_async(enqueue_task)(nft_generator_task, nft_obj.pk, lane=lane)
 
     # wait for result with timeout
     task_result = await async_wait_for_task(task_id)
     if task_result:
-        await sync_to_async(nft_obj.refresh_from_db)()
+        await db_sync_to_async(nft_obj.refresh_from_db)()
         result = await filter_nft_metadata(nft_obj.result)
         return 201, result
     # return task-id instead
@@ -322,7 +407,7 @@ async def nft_post(request, item: NftPostRequest):
         return 202, task
 
 
-@sync_to_async
+@db_sync_to_async
 def filter_nft_metadata(meta: dict) -> dict:
     """Filter `nft_metadata` fields according to configuration"""
     exclude = config.NFT_EXCLUDE_FIELDS
@@ -356,7 +441,7 @@ async def nft_get(request, nft_id: str):
 )
 async def nft_delete(request, nft_id: str):
     nft_obj: Nft = await get_or_404(Nft, nft_id)
-    await sync_to_async(nft_obj.delete)()
+    await db_sync_to_async(nft_obj.delete)()
 
     return 200, Message(detail="Media asset deleted")
 
@@ -421,9 +506,42 @@ async def get_task(request, task_id: str):
     summary="number of queued tasks",
 )
 async def get_health(request):
-    """Returns number of queued tasks."""
-    queued_tasks = await sync_to_async(OrmQ.objects.count)()
-    return QueuedTasks(queued_tasks=queued_tasks)
+    """Returns number of queued tasks in total and per processing lane."""
+    queued_tasks = await db_sync_to_async(OrmQ.objects.count)()
+    lanes = await db_sync_to_async(queue_depths)()
+    return QueuedTasks(queued_tasks=queued_tasks, lanes=lanes)
+
+
+@router.get(
+    "/cache_stats",
+    tags=["task"],
+    response=List[CacheStatsSchema],
+    summary="cache statistics",
+)
+async def get_cache_stats(request):
+    """Returns hit and miss counters of the service caches."""
+    return await db_sync_to_async(list)(CacheStats.objects.order_by("name"))
+
+
+####################################################################################################
+# Helpers                                                                                          #
+####################################################################################################
+
+
+def validate_meta(meta):
+    # type: (Optional[str]) -> Optional[str]
+    """Returns an error message if `meta` is neither a valid Data-URL nor a JSON-string."""
+    if meta:
+        if meta.startswith("data:"):
+            try:
+                DataURL.from_url(meta)
+            except Exception:
+                return "Invalid Data-URL in field meta"
+        else:
+            try:
+                json.loads(meta)
+            except Exception:
+                return "Invalid JSON-string in field meta"
 
 
 ####################################################################################################
@@ -431,30 +549,55 @@ async def get_health(request):
 ####################################################################################################
 
 
-@sync_to_async
-def async_create_generator_task(iscc_pk) -> str:
-    return async_task(iscc_generator_task, iscc_pk)
+@db_sync_to_async
+def async_get_config(name: str):
+    return getattr(config, name)
 
 
-@sync_to_async
-def async_wait_for_task(task_id):
-    return result(task_id, config.PROCESSING_TIMEOUT * 1000)
+@db_sync_to_async
+def async_create_generator_task(iscc_pk) -> str:
+    return start_pipeline(IsccCode.objects.get(pk=iscc_pk))
 
 
-@sync_to_async
-def async_find_task(task_id):
-    task = None
-    try:
-        task = Task.objects.get(id=task_id)
-    except Task.DoesNotExist:
-        for queued in OrmQ.objects.all():
-            if queued.task_id() == task_id:
-                task = queued.task()
-                break
-    return task
+async def async_wait_for_task(task_id):
+    """Wait for a task (following the stages of the generator pipeline it hands over to)."""
+    loop = asyncio.get_running_loop()
+    timeout = await async_get_config("PROCESSING_TIMEOUT")
+    deadline = loop.time() + timeout
+    while True:
+        result = await wait_for_task(task_id, max(deadline - loop.time(), 0))
+        if not is_handover(result):
+            return result
+        task_id = result["next"]
 
 
-@sync_to_async
+@db_sync_to_async
+def async_find_task(task_id):
+    """Find a finished or queued task (the current stage for generator pipeline tasks)."""
+    while True:
+        task = Task.objects.filter(id=task_id).first()
+        if task is None:
+            queued = find_queued_task(task_id)
+            if queued:
+                task = TaskResponse(
+                    id=queued.id,
+                    name=queued.name,
+                    started=queued.started,
+                    queue_position=queued.queue_position,
+                )
+            return task
+        if not is_handover(task.result):
+            return task
+        task_id = task.result["next"]
+
+
+def is_handover(result):
+    # type: (Any) -> bool
+    """Whether a task result hands over to the next stage of the generator pipeline."""
+    return isinstance(result, dict) and "next" in result
+
+
+@db_sync_to_async
 def async_get_iscc_code(pk: Optional[int] = None, iscc: Optional[str] = None):
     try:
         if pk:
@@ -463,3 +606,50 @@ def async_get_iscc_code(pk: Optional[int] = None, iscc: Optional[str] = None):
             return IsccCode.objects.get(iscc=iscc)
     except IsccCode.DoesNotExist:
         return None
+
+
+@db_sync_to_async
+def async_create_batch(media_objs, meta):
+    # type: (List[Media], IsccBatchPostRequest) -> IsccBatch
+    """Create IsccCode objects for all batch items and fan them out to the workers."""
+    batch = IsccBatch.objects.create()
+    data = meta.dict(exclude={"source_urls"})
+    items = [IsccCode(source_file=media_obj, batch=batch, **data) for media_obj in media_objs]
+    items += [IsccCode(source_url=url, batch=batch, **data) for url in meta.source_urls]
+    for iscc_obj in items:
+        iscc_obj.save()
+        start_pipeline(iscc_obj, group=batch.flake)
+    return batch
+
+
+@db_sync_to_async
+def async_batch_status(batch):
+    # type: (IsccBatch) -> IsccBatchResponse
+    """Collect per-item processing status for a batch."""
+    iscc_objs = batch.items.select_related("source_file").order_by("id")
+    failures = {
+        task.id: str(task.result)
+        for task in Task.objects.filter(group=batch.flake, success=False).only("id", "result")
+    }
+    items = []
+    for iscc_obj in iscc_objs:
+        item = IsccBatchItem(
+            id=iscc_obj.flake,
+            source=iscc_obj.source_url or (iscc_obj.source_file and iscc_obj.source_file.name),
+            status="queued",
+        )
+        if iscc_obj.iscc:
+            item.status = "done"
+            item.iscc = iscc_obj.iscc
+            item.result = iscc_obj.result
+        elif iscc_obj.task_id in failures:
+            item.status = "failed"
+            item.error = failures[iscc_obj.task_id]
+        items.append(item)
+    return IsccBatchResponse(
+        batch_id=batch.flake,
+        total=len(items),
+        done=sum(1 for item in items if item.status == "done"),
+        failed=sum(1 for item in items if item.status == "failed"),
+        items=items,
+    )
@@ -7,6 +7,16 @@ class IsccGeneratorConfig(AppConfig):
 
     def ready(self):
         from django.conf import settings
+        from django.db.models.signals import post_save
+        from django_q.models import Task
+        from django_q.signals import pre_enqueue, pre_execute
+        from iscc_generator import notify, pipeline, queues
+
+        post_save.connect(notify.task_saved, sender=Task, dispatch_uid="iscc_generator_notify")
+        post_save.connect(queues.task_saved, sender=Task, dispatch_uid="iscc_generator_dequeue")
+        pre_enqueue.connect(queues.task_enqueued, dispatch_uid="iscc_generator_enqueue")
+        pre_enqueue.connect(pipeline.task_enqueued, dispatch_uid="iscc_generator_pipeline")
+        pre_execute.connect(queues.task_dequeued, dispatch_uid="iscc_generator_execute")
 
         if settings.SENTRY_DSN:
             import sentry_sdk
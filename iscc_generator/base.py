@@ -1,8 +1,13 @@
 """Model base class."""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 from asgiref.sync import sync_to_async
 from loguru import logger as log
 
-from django.db import models
+from django.conf import settings
+from django.db import close_old_connections, models
 from django.contrib import admin
 from model_utils.models import TimeStampedModel
 import iscc_core as ic
@@ -50,7 +55,59 @@ class GeneratorBaseModel(TimeStampedModel):
         return Flake.from_int(self.id).string
 
 
-@sync_to_async
+_db_executor = None  # type: Optional[ThreadPoolExecutor]
+_db_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    # type: () -> ThreadPoolExecutor
+    """Return the shared thread pool for database access from async views."""
+    global _db_executor
+    with _db_executor_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_DB_WORKERS, thread_name_prefix="db"
+            )
+    return _db_executor
+
+
+def _in_db_thread(func):
+    """Run `func` with stale connections of the pool thread closed before and after."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return wrapper
+
+
+def db_sync_to_async(func):
+    """
+    Like `sync_to_async` for functions that access the database.
+
+    With ASYNC_DB_THREAD_SENSITIVE (default) all calls are serialized on the main thread as with
+    plain `sync_to_async`. Otherwise calls run concurrently on a pool of ASYNC_DB_WORKERS threads.
+    Each pool thread holds its own database connection which is checked for reuse (CONN_MAX_AGE)
+    before and after every call.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if settings.ASYNC_DB_THREAD_SENSITIVE:
+            return await sync_to_async(func)(*args, **kwargs)
+        pooled = sync_to_async(
+            _in_db_thread(func), thread_sensitive=False, executor=get_db_executor()
+        )
+        return await pooled(*args, **kwargs)
+
+    return wrapper
+
+
+@db_sync_to_async
 def get_or_404(model: models.Model, flake: str):
     """Get object by flake-id."""
 
@@ -0,0 +1,104 @@
+"""Result caching and cache statistics."""
+import hashlib
+from datetime import timedelta
+from typing import Optional
+from constance import config
+from django.db.models import F
+from django.utils import timezone
+from loguru import logger as log
+import iscc_core as ic
+import iscc_schema as iss
+import iscc_sdk as idk
+from iscc_generator.models import CacheStats, Media, ResultCache
+
+
+RESULT_CACHE = "result"
+DOWNLOAD_CACHE = "download"
+MEDIA_CACHE = "media"
+FORECAST_CACHE = "forecast"
+FORECAST_REMOTE = "forecast-remote"
+
+
+def record_hit(name):
+    # type: (str) -> None
+    """Count a cache hit for the cache with `name`."""
+    CacheStats.objects.get_or_create(name=name)
+    CacheStats.objects.filter(name=name).update(hits=F("hits") + 1)
+
+
+def record_miss(name):
+    # type: (str) -> None
+    """Count a cache miss for the cache with `name`."""
+    CacheStats.objects.get_or_create(name=name)
+    CacheStats.objects.filter(name=name).update(misses=F("misses") + 1)
+
+
+def metadata_hash(meta, fallback_name=None):
+    # type: (iss.IsccMeta, Optional[str]) -> str
+    """
+    SHA-256 hex digest of the canonical (JCS) serialization of embeddable metadata.
+
+    :param IsccMeta meta: Embeddable metadata
+    :param str fallback_name: Name derived from the filename that the Meta-Code falls back to if
+        neither `meta` nor the file provide a name (hashed apart from a user provided name)
+    """
+    data = meta.dict(exclude_unset=True, exclude_none=True)
+    if fallback_name is not None:
+        data["$fallback_name"] = fallback_name
+    return hashlib.sha256(ic.json_canonical(data)).hexdigest()
+
+
+def result_cache_get(datahash, metahash):
+    # type: (str, str) -> Optional[ResultCache]
+    """
+    Lookup a cached ISCC result.
+
+    Entries that expired or whose referenced Media object was deleted are evicted.
+
+    :param str datahash: Blake3 multihash of the source file
+    :param str metahash: Hash of the embeddable metadata (see `metadata_hash`)
+    :return: Cache entry or None
+    """
+    if not config.RESULT_CACHE:
+        return None
+    entry = ResultCache.objects.filter(
+        datahash=datahash, metahash=metahash, version=idk.__version__
+    ).first()
+    if entry and config.RESULT_CACHE_TTL:
+        if entry.created < timezone.now() - timedelta(days=config.RESULT_CACHE_TTL):
+            entry.delete()
+            entry = None
+    if entry and entry.media is None:
+        entry.delete()
+        entry = None
+    if entry is None:
+        record_miss(RESULT_CACHE)
+        return None
+    ResultCache.objects.filter(pk=entry.pk).update(hits=F("hits") + 1, accessed=timezone.now())
+    record_hit(RESULT_CACHE)
+    log.info(f"result cache hit for {datahash}")
+    return entry
+
+
+def result_cache_set(datahash, metahash, result, media_obj):
+    # type: (str, str, dict, Media) -> None
+    """
+    Store an ISCC result and evict least recently used entries above RESULT_CACHE_MAX_ENTRIES.
+
+    :param str datahash: Blake3 multihash of the source file
+    :param str metahash: Hash of the embeddable metadata (see `metadata_hash`)
+    :param dict result: The result of the ISCC generator
+    :param Media media_obj: The Media object the result was generated from
+    """
+    if not config.RESULT_CACHE:
+        return
+    ResultCache.objects.update_or_create(
+        datahash=datahash,
+        metahash=metahash,
+        version=idk.__version__,
+        defaults=dict(result=result, media=media_obj, accessed=timezone.now()),
+    )
+    limit = config.RESULT_CACHE_MAX_ENTRIES
+    if limit:
+        stale = ResultCache.objects.order_by("-accessed").values_list("pk", flat=True)[limit:]
+        ResultCache.objects.filter(pk__in=list(stale)).delete()
@@ -0,0 +1,100 @@
+"""
+Pooled HTTP clients for asset downloads.
+
+Connections are kept alive and reused across downloads (HTTP/2 where the server supports it).
+One synchronous client is shared by all threads of a process (worker tasks) and one asynchronous
+client per event loop (async views). Concurrent downloads per host are limited with semaphores.
+Asynchronous clients and semaphores of event loops that were closed are dropped.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Dict, Tuple
+from urllib.parse import urlparse
+import httpx
+import iscc_sdk as idk
+from django.conf import settings
+
+
+_lock = threading.Lock()
+_clients = {}  # type: Dict[Tuple[int, bool], httpx.Client]
+_async_clients = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+_host_locks = {}  # type: Dict[str, threading.BoundedSemaphore]
+_async_host_locks = weakref.WeakKeyDictionary()  # type: weakref.WeakKeyDictionary
+
+
+def client_options(verify):
+    # type: (bool) -> dict
+    """Options shared by the synchronous and the asynchronous client."""
+    return dict(
+        http2=settings.DOWNLOAD_HTTP2,
+        verify=verify,
+        follow_redirects=True,
+        headers={"user-agent": f"ISCC/{idk.__version__} +http://iscc.codes"},
+        limits=httpx.Limits(
+            max_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+            keepalive_expiry=settings.DOWNLOAD_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_client(verify=True):
+    # type: (bool) -> httpx.Client
+    """Return the pooled client of the current process."""
+    key = (os.getpid(), verify)  # connections must not be shared with forked workers
+    with _lock:
+        if key not in _clients:
+            _clients[key] = httpx.Client(**client_options(verify))
+        return _clients[key]
+
+
+def get_async_client(verify=True):
+    # type: (bool) -> httpx.AsyncClient
+    """Return the pooled client of the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        drop_closed_loops()
+        clients = _async_clients.setdefault(loop, {})
+        if verify not in clients:
+            clients[verify] = httpx.AsyncClient(**client_options(verify))
+        return clients[verify]
+
+
+def host_semaphore(url):
+    # type: (str) -> threading.BoundedSemaphore
+    """Semaphore limiting concurrent downloads from the host of `url` in this process."""
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _host_locks:
+            _host_locks[host] = threading.BoundedSemaphore(
+                settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST
+            )
+        return _host_locks[host]
+
+
+def async_host_semaphore(url):
+    # type: (str) -> asyncio.Semaphore
+    """Semaphore limiting concurrent downloads from the host of `url` in the running event loop."""
+    host = urlparse(url).netloc
+    loop = asyncio.get_running_loop()
+    with _lock:
+        drop_closed_loops()
+        sems = _async_host_locks.setdefault(loop, {})
+        if host not in sems:
+            sems[host] = asyncio.Semaphore(settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST)
+        return sems[host]
+
+
+def drop_closed_loops():
+    # type: () -> None
+    """
+    Drop the clients and semaphores of closed event loops (e.g. from `async_to_sync` calls).
+
+    Their connections can no longer be closed gracefully and are released with the client.
+    Entries of garbage collected loops are removed by the weak mappings.
+    """
+    for registry in (_async_clients, _async_host_locks):
+        for loop in [loop for loop in registry if loop.is_closed()]:
+            del registry[loop]
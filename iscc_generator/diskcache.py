@@ -0,0 +1,135 @@
+"""
+Size bounded on-disk LRU file cache.
+
+Entries are stored as `<root>/<sha256(key)>/data` with a JSON `meta` file next to it. Fills are
+written to a temporary file and atomically renamed into place. Reads touch the entry to record
+recency. Fills and the eviction of least recently used entries are coordinated between processes
+with a `flock` on `<root>/.lock` (shared for fills, exclusive for eviction).
+
+Files are shared with their users by hardlinks where possible and must never be modified in place.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from os.path import exists, getsize, join
+from typing import Optional, Tuple
+from loguru import logger as log
+
+
+class DiskCache:
+    def __init__(self, root, max_size):
+        # type: (str, int) -> None
+        """
+        :param str root: Directory for cached files (created if missing)
+        :param int max_size: Maximum total size of cached files in bytes
+        """
+        self.root = root
+        self.max_size = max_size
+        os.makedirs(root, exist_ok=True)
+
+    def entry_dir(self, key):
+        # type: (str) -> str
+        return join(self.root, hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+    def get(self, key):
+        # type: (str) -> Optional[Tuple[str, dict]]
+        """
+        Lookup a cached file.
+
+        :param str key: Cache key
+        :return: Path of the cached file and its metadata or None
+        """
+        edir = self.entry_dir(key)
+        data_fp, meta_fp = join(edir, "data"), join(edir, "meta")
+        try:
+            with open(meta_fp, "rt", encoding="utf-8") as infile:
+                meta = json.load(infile)
+            os.utime(edir)
+        except (OSError, ValueError):
+            return None
+        if not exists(data_fp):
+            return None
+        return data_fp, meta
+
+    def put(self, key, fp, meta=None):
+        # type: (str, str, Optional[dict]) -> Optional[str]
+        """
+        Store a copy of the local file at `fp` under `key`.
+
+        :param str key: Cache key
+        :param str fp: Local file to be cached (left untouched)
+        :param dict meta: JSON serializable metadata stored with the entry
+        :return: Path of the cached file or None if the file is too large to be cached
+        """
+        if getsize(fp) > self.max_size:
+            return None
+        edir = self.entry_dir(key)
+        with self.locked(fcntl.LOCK_SH):
+            os.makedirs(edir, exist_ok=True)
+            tmp_fp = join(edir, f".data-{os.getpid()}-{time.monotonic_ns()}")
+            link_or_copy(fp, tmp_fp)
+            os.replace(tmp_fp, join(edir, "data"))
+            self.set_meta(key, meta or {})
+        self.evict()
+        return join(edir, "data")
+
+    def set_meta(self, key, meta):
+        # type: (str, dict) -> None
+        """Atomically replace the metadata of an entry."""
+        edir = self.entry_dir(key)
+        fd, tmp_fp = tempfile.mkstemp(dir=edir, prefix=".meta-")
+        with os.fdopen(fd, "wt", encoding="utf-8") as outfile:
+            json.dump(meta, outfile)
+        os.replace(tmp_fp, join(edir, "meta"))
+        os.utime(edir)
+
+    def delete(self, key):
+        # type: (str) -> None
+        shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+
+    def evict(self):
+        # type: () -> None
+        """Delete least recently used entries until the cache fits into `max_size`."""
+        with self.locked():
+            entries = []
+            total = 0
+            for entry in os.scandir(self.root):
+                if not entry.is_dir():
+                    continue
+                try:
+                    size = getsize(join(entry.path, "data"))
+                    accessed = entry.stat().st_mtime
+                except OSError:
+                    continue
+                entries.append((accessed, size, entry.path))
+                total += size
+            entries.sort()
+            while total > self.max_size and entries:
+                _, size, path = entries.pop(0)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                log.debug(f"evicted {path} from disk cache")
+
+    @contextmanager
+    def locked(self, operation=fcntl.LOCK_EX):
+        """Hold the cache lock (exclusive for eviction, shared for fills)."""
+        with open(join(self.root, ".lock"), "a") as lockfile:
+            fcntl.flock(lockfile, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def link_or_copy(src, dst):
+    # type: (str, str) -> None
+    """Hardlink `src` to `dst` (falls back to a copy across filesystems)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
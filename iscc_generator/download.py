@@ -1,15 +1,33 @@
 """Asset retrieval functions"""
+import os
 import re
 import secrets
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import basename, join
 import tempfile
+from typing import Optional, Tuple
 from urllib.parse import urlparse
-import iscc_sdk as idk
-import requests
+import httpx
+from asgiref.sync import sync_to_async
 from constance import config
+from django.conf import settings
+from humanize import naturalsize
+from loguru import logger as log
 from ninja.errors import HttpError
+from iscc_generator.cache import DOWNLOAD_CACHE, MEDIA_CACHE, record_hit, record_miss
+from iscc_generator.client import async_host_semaphore, get_async_client, get_client, host_semaphore
+from iscc_generator.diskcache import DiskCache, link_or_copy
 from iscc_generator.models import Media
-from iscc_generator.storage import clean_filename, store_local_temp
+from iscc_generator.storage import clean_filename, remove_local_temp, store_local_temp
+
+
+CHUNK_SIZE = 1024 * 1024
+RETRY_STATUS = (408, 429)
+
+_download_cache = None  # type: Optional[DiskCache]
+_media_cache = None  # type: Optional[DiskCache]
 
 
 def download_media(media_obj: Media):
@@ -17,43 +35,371 @@ def download_media(media_obj: Media):
     """
     Download Media file to temporary local storage.
 
+    Files in local filesystem storage are hardlinked (or symlinked) instead of copied. Files from
+    remote storage are served from the local media cache if possible. The returned file must be
+    treated as read-only (metadata embedding always works on a copy).
+
     :param Media media_obj: Media object
     :return: local filepath
     """
-    filename = basename(media_obj.source_file.name)
+    filename = media_obj.filename
+    local_fp = local_storage_path(media_obj)
+    if local_fp:
+        tmpfile_path = join(tempfile.mkdtemp(), clean_filename(filename))
+        try:
+            os.link(local_fp, tmpfile_path)
+        except OSError:
+            try:
+                os.symlink(local_fp, tmpfile_path)
+            except OSError:
+                shutil.copyfile(local_fp, tmpfile_path)
+        return tmpfile_path
+    cache = get_media_cache()
+    key = f"cid:{media_obj.cid}" if media_obj.cid else f"file:{media_obj.source_file.name}"
+    if cache:
+        entry = cache.get(key)
+        if entry:
+            tmpfile_path = join(tempfile.mkdtemp(), clean_filename(filename))
+            try:
+                link_or_copy(entry[0], tmpfile_path)
+                record_hit(MEDIA_CACHE)
+                return tmpfile_path
+            except OSError:
+                pass  # evicted concurrently
+        record_miss(MEDIA_CACHE)
     with media_obj.source_file.open("rb") as infile:
         tmpfile_path = store_local_temp(infile, filename)
+    if cache:
+        cache.put(key, tmpfile_path)
     return tmpfile_path
 
 
+def cache_media(media_obj, fp):
+    # type: (Media, str) -> None
+    """Add the local copy `fp` of a remotely stored Media file to the media cache."""
+    cache = get_media_cache()
+    if cache and media_obj.cid and not local_storage_path(media_obj):
+        cache.put(f"cid:{media_obj.cid}", fp)
+
+
+def get_media_cache():
+    # type: () -> Optional[DiskCache]
+    """Return the cache for remotely stored media of this host (None if disabled)."""
+    global _media_cache
+    if not settings.MEDIA_CACHE_SIZE:
+        return None
+    if _media_cache is None:
+        root = settings.MEDIA_CACHE_DIR or join(tempfile.gettempdir(), "iscc-media-cache")
+        _media_cache = DiskCache(root, settings.MEDIA_CACHE_SIZE * 1000000)
+    return _media_cache
+
+
+def local_storage_path(media_obj):
+    # type: (Media) -> Optional[str]
+    """Return the local filesystem path of a stored Media file (None for remote storage)."""
+    try:
+        fp = media_obj.source_file.path
+    except NotImplementedError:
+        return None
+    return fp if os.path.isfile(fp) else None
+
+
 def download_url(url):
     # type: (str) -> str
     """
     Download file from url to temporary local storage
 
+    Responses with validators (ETag/Last-Modified) are kept in the download cache and revalidated
+    with conditional requests on later downloads of the same url. Large files are downloaded in
+    parallel byte-range segments if the server supports range requests.
+
     :param str url: Url for file download
     :return: local filepath
     """
-    headers = {"user-agent": f"ISCC/{idk.__version__} +http://iscc.codes"}
-    stream = requests.get(
-        url,
-        headers=headers,
-        stream=True,
-        verify=config.DOWNLOAD_VERIFY_TLS,
-        timeout=config.DOWNLOAD_TIMEOUT,
+    client = get_client(verify=config.DOWNLOAD_VERIFY_TLS)
+    limit = config.DOWNLOAD_SIZE_LIMIT * 1000000
+    cached_fp, tmpfile_path = None, None
+    try:
+        cached_fp, headers = cache_lookup(url, limit)
+        with host_semaphore(url):
+            start = time.perf_counter()
+            with client.stream(
+                "GET", url, headers=headers, timeout=config.DOWNLOAD_TIMEOUT
+            ) as stream:
+                if cached_fp and stream.status_code == 304:
+                    record_hit(DOWNLOAD_CACHE)
+                    log.info(f"download cache revalidated {url}")
+                    fresh_fp, cached_fp = cached_fp, None
+                    return fresh_fp
+                stream.raise_for_status()
+                ttfb = time.perf_counter() - start
+                tmpfile_path = local_temp_path(url, stream, limit)
+                segmented = supports_segments(stream)
+                if not segmented:
+                    size = 0
+                    with open(tmpfile_path, "wb") as tmpfile:
+                        for chunk in stream.iter_bytes(CHUNK_SIZE):
+                            size = check_size(url, size + len(chunk), limit)
+                            tmpfile.write(chunk)
+        if segmented:
+            # segments take their own connection slots for the host
+            size = download_segments(client, url, stream, tmpfile_path)
+    except Exception:
+        # no partial downloads are left behind
+        remove_local_temp(tmpfile_path)
+        raise
+    finally:
+        # the cached copy is stale (or the download failed)
+        cache_discard(cached_fp)
+    log_download(url, stream, size, ttfb, time.perf_counter() - start)
+    record_miss(DOWNLOAD_CACHE)
+    cache_store(url, stream, tmpfile_path)
+    return tmpfile_path
+
+
+async def async_download_url(url):
+    # type: (str) -> str
+    """
+    Download file from url to temporary local storage (from within an event loop).
+
+    Disk and download cache work runs in threads (see `in_thread`) to keep the event loop free.
+
+    :param str url: Url for file download
+    :return: local filepath
+    """
+    client = get_async_client(verify=await sync_to_async(getattr)(config, "DOWNLOAD_VERIFY_TLS"))
+    limit = await sync_to_async(getattr)(config, "DOWNLOAD_SIZE_LIMIT") * 1000000
+    timeout = await sync_to_async(getattr)(config, "DOWNLOAD_TIMEOUT")
+    cached_fp, tmpfile_path = None, None
+    try:
+        cached_fp, headers = await in_thread(cache_lookup)(url, limit)
+        async with async_host_semaphore(url):
+            start = time.perf_counter()
+            async with client.stream("GET", url, headers=headers, timeout=timeout) as stream:
+                if cached_fp and stream.status_code == 304:
+                    await sync_to_async(record_hit)(DOWNLOAD_CACHE)
+                    log.info(f"download cache revalidated {url}")
+                    fresh_fp, cached_fp = cached_fp, None
+                    return fresh_fp
+                stream.raise_for_status()
+                ttfb = time.perf_counter() - start
+                tmpfile_path = await in_thread(local_temp_path)(url, stream, limit)
+                size = 0
+                tmpfile = await in_thread(open)(tmpfile_path, "wb")
+                try:
+                    write = in_thread(tmpfile.write)
+                    async for chunk in stream.aiter_bytes(CHUNK_SIZE):
+                        size = check_size(url, size + len(chunk), limit)
+                        await write(chunk)
+                finally:
+                    await in_thread(tmpfile.close)()
+    except Exception:
+        # no partial downloads are left behind
+        await in_thread(remove_local_temp)(tmpfile_path)
+        raise
+    finally:
+        # the cached copy is stale (or the download failed)
+        await in_thread(cache_discard)(cached_fp)
+    log_download(url, stream, size, ttfb, time.perf_counter() - start)
+    await sync_to_async(record_miss)(DOWNLOAD_CACHE)
+    await in_thread(cache_store)(url, stream, tmpfile_path)
+    return tmpfile_path
+
+
+def in_thread(func):
+    """Like `sync_to_async` for blocking file operations (run concurrently in the thread pool)."""
+    return sync_to_async(func, thread_sensitive=False)
+
+
+def get_download_cache():
+    # type: () -> Optional[DiskCache]
+    """Return the download cache of this host (None if disabled)."""
+    global _download_cache
+    if not settings.DOWNLOAD_CACHE_SIZE:
+        return None
+    if _download_cache is None:
+        root = settings.DOWNLOAD_CACHE_DIR or join(tempfile.gettempdir(), "iscc-download-cache")
+        _download_cache = DiskCache(root, settings.DOWNLOAD_CACHE_SIZE * 1000000)
+    return _download_cache
+
+
+def cache_lookup(url, limit):
+    # type: (str, int) -> Tuple[Optional[str], dict]
+    """
+    Prepare a conditional request for a cached download.
+
+    The cached file is linked to local temporary storage right away, so it survives concurrent
+    eviction in case the server confirms that it is still fresh. Otherwise the caller removes it
+    with `cache_discard`.
+
+    :param str url: Url for file download
+    :param int limit: Maximum download size in bytes
+    :return: Local filepath of the cached file (or None) and the conditional request headers
+    """
+    cache = get_download_cache()
+    entry = cache.get(url) if cache else None
+    if entry is None:
+        return None, {}
+    data_fp, meta = entry
+    if meta.get("size", 0) > limit:
+        return None, {}
+    tmpfile_path = join(tempfile.mkdtemp(), meta["filename"])
+    try:
+        link_or_copy(data_fp, tmpfile_path)
+    except OSError:
+        remove_local_temp(tmpfile_path)
+        return None, {}
+    headers = {}
+    if meta.get("etag"):
+        headers["if-none-match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["if-modified-since"] = meta["last_modified"]
+    return tmpfile_path, headers
+
+
+def cache_store(url, response, fp):
+    # type: (str, httpx.Response, str) -> None
+    """Store a downloaded file in the download cache if the response can be revalidated."""
+    cache = get_download_cache()
+    etag = response.headers.get("etag")
+    last_modified = response.headers.get("last-modified")
+    if cache is None or not (etag or last_modified):
+        return
+    if "no-store" in response.headers.get("cache-control", ""):
+        return
+    meta = dict(
+        etag=etag, last_modified=last_modified, filename=basename(fp), size=os.path.getsize(fp)
     )
+    cache.put(url, fp, meta)
+
+
+def cache_discard(fp):
+    # type: (Optional[str]) -> None
+    """Remove a cached file linked by `cache_lookup` that turned out to be stale."""
+    remove_local_temp(fp)
 
+
+def supports_segments(response):
+    # type: (httpx.Response) -> bool
+    """Check if a response is large enough for a segmented download and allows range requests."""
+    if settings.DOWNLOAD_SEGMENTS < 2:
+        return False
+    if response.headers.get("accept-ranges", "").lower() != "bytes":
+        return False
+    size = int(response.headers.get("content-length") or 0)
+    return size > settings.DOWNLOAD_SEGMENT_SIZE * 1000000
+
+
+def download_segments(client, url, response, fp):
+    # type: (httpx.Client, str, httpx.Response, str) -> int
+    """
+    Download `url` with concurrent byte-range requests into a preallocated file.
+
+    :param httpx.Client client: Pooled HTTP client
+    :param str url: Url for file download
+    :param httpx.Response response: Initial response advertising range support (size checked)
+    :param str fp: Local filepath to write to
+    :return: Size of the downloaded file
+    """
+    size = int(response.headers["content-length"])
+    headers = {}
+    # make sure all segments are taken from the same version of the file
+    validator = response.headers.get("etag") or response.headers.get("last-modified")
+    if validator:
+        headers["if-range"] = validator
+    segment_size = settings.DOWNLOAD_SEGMENT_SIZE * 1000000
+    ranges = [(pos, min(pos + segment_size, size) - 1) for pos in range(0, size, segment_size)]
+    fd = os.open(fp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.truncate(fd, size)
+        with ThreadPoolExecutor(max_workers=settings.DOWNLOAD_SEGMENTS) as pool:
+            futures = [
+                pool.submit(download_segment, client, url, fd, first, last, headers)
+                for first, last in ranges
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        os.close(fd)
+    log.debug(f"downloaded {url} in {len(ranges)} segments")
+    return size
+
+
+def download_segment(client, url, fd, first, last, headers):
+    # type: (httpx.Client, str, int, int, int, dict) -> None
+    """
+    Download the byte range `first`-`last` (inclusive) of `url` to the open file `fd`.
+
+    Each request takes a connection slot of the host (see `host_semaphore`). Failed segments
+    (transport errors, 408, 429 and 5xx responses) are resumed from the last received byte up to
+    DOWNLOAD_SEGMENT_RETRIES times.
+    """
+    pos = first
+    attempt = 0
+    while True:
+        try:
+            segment_headers = dict(headers, range=f"bytes={pos}-{last}")
+            with host_semaphore(url), client.stream(
+                "GET", url, headers=segment_headers, timeout=config.DOWNLOAD_TIMEOUT
+            ) as stream:
+                if stream.status_code in RETRY_STATUS or stream.status_code >= 500:
+                    stream.raise_for_status()
+                if stream.status_code == 200 and "if-range" in headers:
+                    raise HttpError(409, message=f"Source {url} changed during download")
+                if stream.status_code != 206:
+                    raise HttpError(400, message=f"Range request for {url} failed")
+                for chunk in stream.iter_bytes(CHUNK_SIZE):
+                    if pos + len(chunk) > last + 1:
+                        raise HttpError(400, message=f"Range response for {url} exceeds segment")
+                    os.pwrite(fd, chunk, pos)
+                    pos += len(chunk)
+            if pos != last + 1:
+                raise httpx.ReadError(f"Incomplete segment {first}-{last} for {url}")
+            return
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            attempt += 1
+            if attempt > settings.DOWNLOAD_SEGMENT_RETRIES:
+                raise
+            log.warning(f"retry segment {pos}-{last} of {url} ({attempt}): {e}")
+            if isinstance(e, httpx.HTTPStatusError):
+                time.sleep(retry_delay(e.response, attempt))
+
+
+def retry_delay(response, attempt):
+    # type: (httpx.Response, int) -> float
+    """Seconds to wait before retrying a request (Retry-After header, capped at 10 seconds)."""
+    retry_after = response.headers.get("retry-after", "")
+    if retry_after.isdigit():
+        return min(float(retry_after), 10.0)
+    return min(0.5 * attempt, 10.0)
+
+
+def check_size(url, size, limit):
+    # type: (str, int, int) -> int
+    """Raise HttpError if `size` exceeds the download size `limit`."""
+    if size > limit:
+        raise HttpError(400, message=f"Download of {size} for {url} exceeds {limit} limit")
+    return size
+
+
+def local_temp_path(url, response, limit):
+    # type: (str, httpx.Response, int) -> str
+    """
+    Check the announced size of a download and choose a local temporary filepath for it.
+
+    :param str url: Url for file download
+    :param httpx.Response response: Response with headers received
+    :param int limit: Maximum download size in bytes
+    :return: local filepath
+    """
     # Check file size
-    size = stream.headers.get("content-length")
+    size = response.headers.get("content-length")
     if size:
-        size = int(size)
-        limit = config.DOWNLOAD_SIZE_LIMIT * 1000000
-        if size and size > limit:
-            raise HttpError(400, message=f"Download of {size} for {url} exceeds {limit} limit")
+        check_size(url, int(size), limit)
 
     # Get filename
     filename = None
-    codi = stream.headers.get("content-disposition")
+    codi = response.headers.get("content-disposition")
     if codi:
         try:
             filename = re.findall("filename=(.+)", codi)[0]
@@ -66,11 +412,15 @@ def download_url(url):
         filename = secrets.token_hex(64)
     filename = clean_filename(filename)
 
-    # Stream to local temp storage
     tempdir = tempfile.mkdtemp()
-    tmpfile_path = join(tempdir, filename)
-    with open(tmpfile_path, "wb") as tmpfile:
-        chunk_size = 1024 * 1024
-        for chunk in stream.iter_content(chunk_size):
-            tmpfile.write(chunk)
-    return tmpfile_path
+    return join(tempdir, filename)
+
+
+def log_download(url, response, size, ttfb, seconds):
+    # type: (str, httpx.Response, int, float, float) -> None
+    """Log time to first byte and throughput of a download."""
+    throughput = size / seconds if seconds else 0
+    log.info(
+        f"downloaded {naturalsize(size)} from {url} via {response.http_version} - "
+        f"ttfb {ttfb * 1000:.0f} ms - {naturalsize(throughput)}/s"
+    )
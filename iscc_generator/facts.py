@@ -0,0 +1,195 @@
+"""
+Memoization of expensive per-file probes.
+
+Within a `scope` (one worker task run) the mediatype, the extracted metadata and the IPFS CID of
+a file are computed at most once per unique content. Files are identified by their blake3
+datahash if it was registered from a hashing pass (see `register`), otherwise by filesystem
+identity (hardlinked copies share an entry). Extracted metadata is also looked up from stored
+Media objects with the same datahash. Outside of a scope all probes run unmemoized.
+"""
+import functools
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Tuple
+import iscc_schema as iss
+import iscc_sdk as idk
+from iscc_sdk.metadata import EMBEDDERS, EXTRACTORS
+from iscc_generator.hashing import Digests, wrap_cid
+
+
+_facts = ContextVar("iscc_generator_facts", default=None)
+
+MEDIATYPE = "mediatype"
+METADATA = "metadata"
+CID = "cid"
+
+
+@contextmanager
+def scope():
+    """Memoize probes until the outermost scope exits."""
+    if _facts.get() is not None:
+        yield
+        return
+    token = _facts.set(dict(digests={}, probes={}))
+    try:
+        yield
+    finally:
+        _facts.reset(token)
+
+
+def scoped(func):
+    """Decorator running `func` within a memoization `scope`."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with scope():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def file_identity(fp):
+    # type: (str) -> tuple
+    stat = os.stat(fp)
+    return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def register(fp, digests):
+    # type: (str, Digests) -> None
+    """Register the Digests of the file at `fp` so its probes are keyed by content."""
+    facts = _facts.get()
+    if facts is not None:
+        facts["digests"][file_identity(fp)] = digests
+
+
+def digests(fp):
+    # type: (str) -> Optional[Digests]
+    """Return the registered Digests of the file at `fp`."""
+    facts = _facts.get()
+    if facts is not None:
+        return facts["digests"].get(file_identity(fp))
+
+
+def datahash(fp):
+    # type: (str) -> Optional[str]
+    """Return the registered datahash of the file at `fp`."""
+    registered = digests(fp)
+    return registered.datahash if registered else None
+
+
+def memoized(name, fp, func, *args):
+    """Return the memoized result of `func(fp, *args)`."""
+    facts = _facts.get()
+    if facts is None:
+        return func(fp, *args)
+    key = (name, datahash(fp) or file_identity(fp)) + args
+    if key not in facts["probes"]:
+        facts["probes"][key] = func(fp, *args)
+    return facts["probes"][key]
+
+
+def seed(name, fp, value):
+    """Provide the already known result of probe `name` for the file at `fp`."""
+    facts = _facts.get()
+    if facts is not None:
+        facts["probes"][(name, datahash(fp) or file_identity(fp))] = value
+
+
+def mediatype_and_mode(fp):
+    # type: (str) -> Tuple[str, str]
+    return memoized(MEDIATYPE, fp, idk.mediatype_and_mode)
+
+
+def extract_metadata(fp):
+    # type: (str) -> iss.IsccMeta
+    """Extract metadata (reusing metadata stored for identical content)."""
+    return memoized(METADATA, fp, _extract_metadata)
+
+
+def _extract_metadata(fp):
+    # type: (str) -> iss.IsccMeta
+    from iscc_generator.models import Media
+
+    dh = datahash(fp)
+    if dh:
+        stored = Media.objects.filter(datahash=dh, metadata__isnull=False).first()
+        if stored:
+            return idk.IsccMeta.construct(
+                **{k: v for k, v in stored.metadata.items() if v is not None}
+            )
+    mime, mode = mediatype_and_mode(fp)
+    extractor = EXTRACTORS.get(mode)
+    if extractor:
+        return idk.IsccMeta.construct(**extractor(fp))
+
+
+def ipfs_cidv1(fp, wrap=False):
+    # type: (str, bool) -> str
+    """IPFS CIDv1 of the file (taken from registered Digests if possible)."""
+    registered = digests(fp)
+    if wrap:
+        # wrapped CIDs depend on the filename
+        if registered and registered.ipfs_root:
+            return wrap_cid(registered.ipfs_root, os.path.basename(fp))
+        return memoized(CID, fp, _ipfs_cidv1_wrapped, os.path.basename(fp))
+    if registered:
+        return registered.cid
+    return memoized(CID, fp, idk.ipfs_cidv1)
+
+
+def _ipfs_cidv1_wrapped(fp, filename):
+    # type: (str, str) -> str
+    return idk.ipfs_cidv1(fp, wrap=True)
+
+
+def embed_metadata(fp, meta):
+    # type: (str, iss.IsccMeta) -> Optional[str]
+    """Embed metadata into a copy of the media file (see `iscc_sdk.embed_metadata`)."""
+    mime, mode = mediatype_and_mode(fp)
+    embedder = EMBEDDERS.get(mode)
+    if embedder:
+        return embedder(fp, meta)
+
+
+# Fields that the embedder of a mode writes so that its extractor reads them back unchanged
+# (iscc-sdk 0.4.9) and whether the embedded file keeps the other metadata of the source file.
+# Image creators end up as XMP lists, audio names as the unmapped ISCC:TITLE tag, video files
+# only carry the embedded tags (`-map_metadata 1`) and text files are not embedded as mapped.
+EMBED_ROUNDTRIP = {
+    "image": (("name", "description", "meta", "license", "rights"), True),
+    "audio": (("description", "meta", "license", "acquire"), True),
+    "video": (("name", "description", "meta", "creator", "rights", "license", "acquire"), False),
+}
+
+
+def embedded_metadata(metadata, mode, meta):
+    # type: (Optional[dict], str, iss.IsccMeta) -> Optional[dict]
+    """
+    Predict the extracted metadata of a file with `metadata` after embedding `meta`.
+
+    :param dict metadata: Extracted metadata of the source file
+    :param str mode: Processing mode of the source file
+    :param IsccMeta meta: The metadata to embed
+    :return: The merged metadata or None if it must be extracted from the embedded file
+    """
+    if metadata is None or mode not in EMBED_ROUNDTRIP:
+        return None
+    fields, keeps = EMBED_ROUNDTRIP[mode]
+    embedded = meta.dict(exclude_unset=True, exclude_none=True)
+    for field, value in embedded.items():
+        if field not in fields or not plain(value):
+            return None
+    merged = dict(metadata) if keeps else {}
+    merged.update(embedded)
+    return iss.IsccMeta.construct(**merged).dict(exclude_unset=False)
+
+
+def plain(value):
+    # type: (object) -> bool
+    """Whether a value survives the escaping and normalization of embedders and extractors."""
+    if not isinstance(value, str) or not value or value != value.strip():
+        return False
+    if value.startswith('"') or "\\" in value:
+        return False
+    return all(ord(char) >= 32 for char in value)
@@ -0,0 +1,156 @@
+"""
+Remote ISCC-ID forecasting with a latency budget.
+
+Remote forecasts are requested with the pooled HTTP client and cached by (iscc_code, chain,
+wallet). If the remote does not answer within ISCC_ID_FORECAST_BUDGET the locally computed
+ISCC-ID is used while the remote request completes in the background and fills the cache. A
+circuit breaker skips the remote after repeated errors or slow responses until a cooldown passed.
+
+Cache hits and misses are counted as `forecast` and remote answers (hits) versus local
+fallbacks (misses) as `forecast-remote` in the cache statistics. Breaker state changes are
+logged.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Optional
+from django.conf import settings
+from django.core.cache import cache
+from loguru import logger as log
+from iscc_generator.cache import FORECAST_CACHE, FORECAST_REMOTE, record_hit, record_miss
+from iscc_generator.client import get_client
+
+
+_executor = None  # type: Optional[ThreadPoolExecutor]
+_executor_lock = threading.Lock()
+
+
+class CircuitBreaker:
+    """Skip a failing remote service for a cooldown period (closed -> open -> half-open)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name, threshold, cooldown):
+        # type: (str, int, float) -> None
+        """
+        :param str name: Name of the remote service (for logging)
+        :param int threshold: Consecutive failures after which the breaker opens
+        :param float cooldown: Seconds until an open breaker lets a trial request pass
+        """
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened = 0.0
+        self.state = self.CLOSED
+        self.lock = threading.Lock()
+
+    def allow(self):
+        # type: () -> bool
+        """Whether a request to the remote service may be made."""
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened >= self.cooldown:
+                self._set_state(self.HALF_OPEN)
+                return True
+            return self.state == self.CLOSED
+
+    def record(self, success):
+        # type: (bool) -> None
+        """Record the outcome of a request to the remote service."""
+        with self.lock:
+            if success:
+                self.failures = 0
+                if self.state != self.CLOSED:
+                    self._set_state(self.CLOSED)
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+                if self.state != self.OPEN:
+                    self._set_state(self.OPEN)
+
+    def _set_state(self, state):
+        # type: (str) -> None
+        log.warning(f"circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+
+
+breaker = CircuitBreaker(
+    "iscc-id-forecast",
+    settings.ISCC_ID_FORECAST_BREAKER_THRESHOLD,
+    settings.ISCC_ID_FORECAST_BREAKER_COOLDOWN,
+)
+
+
+def forecast(data, local_iscc_id):
+    # type: (dict, str) -> str
+    """
+    Forecast an ISCC-ID remotely within the latency budget.
+
+    :param dict data: Forecast request with `iscc_code`, `chain_id` and `wallet`
+    :param str local_iscc_id: Locally computed ISCC-ID used as fallback
+    :return: The remote ISCC-ID or `local_iscc_id`
+    """
+    key = cache_key(data)
+    iscc_id = cache.get(key)
+    if iscc_id:
+        record_hit(FORECAST_CACHE)
+        return iscc_id
+    record_miss(FORECAST_CACHE)
+    if not breaker.allow():
+        log.warning("iscc-id remote forecasting suspended, fallback to local")
+        record_miss(FORECAST_REMOTE)
+        return local_iscc_id
+    future = get_executor().submit(remote_forecast, key, data)
+    try:
+        iscc_id = future.result(timeout=settings.ISCC_ID_FORECAST_BUDGET)
+    except TimeoutError:
+        log.warning("iscc-id remote forecasting exceeded latency budget, fallback to local")
+    except Exception as e:
+        log.warning("failed iscc-id remote forecasting, fallback to local")
+        log.exception(e)
+    else:
+        record_hit(FORECAST_REMOTE)
+        return iscc_id
+    record_miss(FORECAST_REMOTE)
+    return local_iscc_id
+
+
+def remote_forecast(key, data):
+    # type: (str, dict) -> str
+    """Request a forecast from ISCC_ID_FORECAST_URL and cache the result (runs in the pool)."""
+    start = time.monotonic()
+    try:
+        resp = get_client().post(
+            settings.ISCC_ID_FORECAST_URL, json=data, timeout=settings.ISCC_ID_FORECAST_TIMEOUT
+        )
+        resp.raise_for_status()
+        iscc_id = resp.json()["iscc_id"]
+    except Exception:
+        breaker.record(False)
+        raise
+    # slow answers count as failures but are still cached
+    breaker.record(time.monotonic() - start <= settings.ISCC_ID_FORECAST_BUDGET)
+    cache.set(key, iscc_id, settings.ISCC_ID_FORECAST_CACHE_TTL)
+    return iscc_id
+
+
+def cache_key(data):
+    # type: (dict) -> str
+    ident = f"{data['iscc_code']}|{data['chain_id']}|{data['wallet']}"
+    return "forecast:" + hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+
+def get_executor():
+    # type: () -> ThreadPoolExecutor
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ISCC_ID_FORECAST_WORKERS,
+                thread_name_prefix="forecast",
+            )
+        return _executor
@@ -0,0 +1,412 @@
+"""Streaming hash functions for media files."""
+import hashlib
+import sys
+from array import array
+import mmap
+import os
+import threading
+from base64 import b32encode
+from typing import List, NamedTuple, Optional, Tuple
+import iscc_core as ic
+import xxhash
+from iscc_core.cdc import alg_cdc_offset, alg_cdc_params
+from django.conf import settings
+
+
+IPFS_CHUNK_SIZE = 262144
+IPFS_MAX_LINKS = 174
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+
+
+class Digests(NamedTuple):
+    """Hashes collected while streaming a media file."""
+
+    cid: str
+    datahash: str
+    size: int
+    instance_code: Optional[str] = None
+    data_code: Optional[str] = None
+    chunks: Optional[bytes] = None
+    ipfs_root: Optional["IpfsLink"] = None
+
+
+class IpfsLink(NamedTuple):
+    cid: bytes
+    filesize: int
+    tsize: int
+
+
+def _varint(n):
+    # type: (int) -> bytes
+    buf = bytearray()
+    while True:
+        towrite = n & 0x7F
+        n >>= 7
+        if n:
+            buf.append(towrite | 0x80)
+        else:
+            buf.append(towrite)
+            return bytes(buf)
+
+
+def _pb_bytes(field, data):
+    # type: (int, bytes) -> bytes
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+
+def _pb_varint(field, value):
+    # type: (int, int) -> bytes
+    return _varint(field << 3) + _varint(value)
+
+
+def _cidv1(codec, data):
+    # type: (int, bytes) -> bytes
+    return _varint(1) + _varint(codec) + b"\x12\x20" + hashlib.sha256(data).digest()
+
+
+def cid_to_str(cid):
+    # type: (bytes) -> str
+    """Encode binary CIDv1 with lowercase base32 multibase."""
+    return "b" + b32encode(cid).decode("ascii").lower().rstrip("=")
+
+
+def _dag_pb_node(links, data):
+    # type: (List[Tuple[bytes, str, int]], bytes) -> bytes
+    """Serialize a dag-pb node (links are encoded before data)."""
+    node = b""
+    for cid, name, tsize in links:
+        link = _pb_bytes(1, cid) + _pb_bytes(2, name.encode("utf-8")) + _pb_varint(3, tsize)
+        node += _pb_bytes(2, link)
+    return node + _pb_bytes(1, data)
+
+
+def wrap_cid(root, filename):
+    # type: (IpfsLink, str) -> str
+    """
+    IPFS CIDv1 of a file wrapped with a directory (`ipfs add --wrap-with-directory`).
+
+    :param IpfsLink root: Link to the root node of the file DAG
+    :param str filename: Name of the file within the directory
+    :return: Directory CIDv1 with the filename appended (`<cid>/<filename>`)
+    """
+    node = _dag_pb_node([(root.cid, filename, root.tsize)], _pb_varint(1, UNIXFS_DIRECTORY))
+    return f"{cid_to_str(_cidv1(CODEC_DAG_PB, node))}/{filename}"
+
+
+class IpfsHasher:
+    """
+    Incremental IPFS CIDv1 hasher.
+
+    Builds the same balanced UnixFS DAG with raw leaves and 256 KiB chunks as
+    `ipfs add --cid-version=1` without holding more than one chunk in memory.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.levels = []  # type: List[List[IpfsLink]]
+        self.leaves = 0
+
+    def push(self, data):
+        # type: (bytes) -> None
+        self.buffer.extend(data)
+        while len(self.buffer) >= IPFS_CHUNK_SIZE:
+            chunk = bytes(self.buffer[:IPFS_CHUNK_SIZE])
+            del self.buffer[:IPFS_CHUNK_SIZE]
+            self._add_leaf(chunk)
+
+    def root(self):
+        # type: () -> IpfsLink
+        """Finalize the DAG and return the link to its root node."""
+        if self.buffer or not self.leaves:
+            self._add_leaf(bytes(self.buffer))
+            self.buffer = bytearray()
+        level = 0
+        while level < len(self.levels):
+            links = self.levels[level]
+            is_top = all(not higher for higher in self.levels[level + 1 :])
+            if is_top and len(links) == 1:
+                return links[0]
+            if links:
+                self.levels[level] = []
+                self._append(level + 1, self._make_node(links))
+            level += 1
+
+    def cid(self):
+        # type: () -> str
+        return cid_to_str(self.root().cid)
+
+    def _add_leaf(self, chunk):
+        # type: (bytes) -> None
+        self.leaves += 1
+        self._append(0, IpfsLink(_cidv1(CODEC_RAW, chunk), len(chunk), len(chunk)))
+
+    def _append(self, level, link):
+        # type: (int, IpfsLink) -> None
+        if len(self.levels) <= level:
+            self.levels.append([])
+        self.levels[level].append(link)
+        if len(self.levels[level]) == IPFS_MAX_LINKS:
+            links = self.levels[level]
+            self.levels[level] = []
+            self._append(level + 1, self._make_node(links))
+
+    @staticmethod
+    def _make_node(links):
+        # type: (List[IpfsLink]) -> IpfsLink
+        filesize = sum(link.filesize for link in links)
+        unixfs = _pb_varint(1, UNIXFS_FILE) + _pb_varint(3, filesize)
+        for link in links:
+            unixfs += _pb_varint(4, link.filesize)
+        node = _dag_pb_node([(link.cid, "", link.tsize) for link in links], unixfs)
+        tsize = len(node) + sum(link.tsize for link in links)
+        return IpfsLink(_cidv1(CODEC_DAG_PB, node), filesize, tsize)
+
+
+class MediaHasher:
+    """
+    Computes IPFS CIDv1, blake3 datahash and size in a single streaming pass.
+
+    With `data=True` the content defined chunk features of the ISCC Data-Code are collected in
+    the same pass.
+    """
+
+    def __init__(self, data=False, instance=True):
+        # type: (bool, bool) -> None
+        """
+        :param bool data: Also collect the ISCC Data-Code chunk features
+        :param bool instance: Push data to the Instance-Code hasher (set False if the
+            `instance` hasher is fed separately)
+        """
+        self.ipfs = IpfsHasher()
+        self.instance = ic.InstanceHasherV0()
+        self.data = ic.DataHasherV0() if data else None
+        self.stream_instance = instance
+        self.size = 0
+
+    def push(self, data):
+        # type: (bytes) -> None
+        self.size += len(data)
+        self.ipfs.push(data)
+        if self.stream_instance:
+            self.instance.push(data)
+        if self.data:
+            self.data.push(data)
+
+    def digests(self):
+        # type: () -> Digests
+        data_code, chunks = None, None
+        if self.data:
+            data_code = "ISCC:" + self.data.code(bits=ic.core_opts.data_bits)
+            chunks = pack_chunks(self.data.chunk_sizes, self.data.chunk_features)
+        root = self.ipfs.root()
+        return Digests(
+            cid=cid_to_str(root.cid),
+            datahash=self.instance.multihash(),
+            size=self.size,
+            instance_code="ISCC:" + self.instance.code(bits=ic.core_opts.instance_bits),
+            data_code=data_code,
+            chunks=chunks,
+            ipfs_root=root,
+        )
+
+
+def hash_file(fp, data=False, chunk_size=ic.core_opts.io_read_size, mt_threshold=None):
+    # type: (str, bool, int, Optional[int]) -> Digests
+    """
+    Compute Digests for a local file with a single pass over the memory-mapped file.
+
+    For files of at least `mt_threshold` bytes the blake3 Instance-Code hash is computed with
+    blake3´s multithreaded mode over the whole mapping in a background thread, concurrently with
+    the other hashers.
+
+    :param str fp: Local filepath
+    :param bool data: Also compute the ISCC Data-Code
+    :param int chunk_size: Number of bytes pushed to the hashers at once
+    :param int mt_threshold: Minimum filesize for multithreaded blake3 (default from settings)
+    :return: Digests of the file
+    """
+    if mt_threshold is None:
+        mt_threshold = settings.INSTANCE_MT_THRESHOLD * 1000000
+    with open(fp, "rb") as infile:
+        size = os.fstat(infile.fileno()).st_size
+        hasher = MediaHasher(data=data, instance=size < mt_threshold)
+        if size == 0:
+            return hasher.digests()
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            worker = None
+            if not hasher.stream_instance:
+                worker = threading.Thread(target=_push_mapped, args=(hasher.instance, mm))
+                worker.start()
+            try:
+                for pos in range(0, len(mm), chunk_size):
+                    hasher.push(mm[pos : pos + chunk_size])
+            finally:
+                if worker:
+                    worker.join()
+    return hasher.digests()
+
+
+def _push_mapped(instance, mm):
+    # type: (ic.InstanceHasherV0, mmap.mmap) -> None
+    """Hash a complete memory mapping at once (blake3 releases the GIL and uses all cores)."""
+    with memoryview(mm) as view:
+        instance.push(view)
+
+
+def pack_chunks(sizes, features):
+    # type: (List[int], List[int]) -> bytes
+    """Serialize a CDC chunk table (chunk sizes and xxh32 features) as little endian uint32."""
+    table = array("I", sizes + features)
+    if sys.byteorder == "big":
+        table.byteswap()
+    return table.tobytes()
+
+
+def unpack_chunks(chunks):
+    # type: (bytes) -> Tuple[List[int], List[int]]
+    """Deserialize a CDC chunk table into chunk sizes and features."""
+    table = array("I", chunks)
+    if sys.byteorder == "big":
+        table.byteswap()
+    half = len(table) // 2
+    return table[:half].tolist(), table[half:].tolist()
+
+
+def data_code_from_features(features):
+    # type: (List[int]) -> str
+    """Encode ISCC Data-Code from CDC chunk features."""
+    code = ic.encode_component(
+        mtype=ic.MT.DATA,
+        stype=ic.ST.NONE,
+        version=ic.VS.V0,
+        bit_length=ic.core_opts.data_bits,
+        digest=ic.alg_minhash_256(features),
+    )
+    return "ISCC:" + code
+
+
+def restore_digests(cid, datahash, size, chunks):
+    # type: (str, str, int, bytes) -> Digests
+    """Rebuild the Digests of a file from its persisted hashes and CDC chunk table."""
+    instance_code = ic.encode_component(
+        mtype=ic.MT.INSTANCE,
+        stype=ic.ST.NONE,
+        version=ic.VS.V0,
+        bit_length=ic.core_opts.instance_bits,
+        digest=bytes.fromhex(datahash[4:]),
+    )
+    sizes, features = unpack_chunks(chunks)
+    return Digests(
+        cid=cid,
+        datahash=datahash,
+        size=size,
+        instance_code="ISCC:" + instance_code,
+        data_code=data_code_from_features(features),
+        chunks=chunks,
+    )
+
+
+def derive_data_code(src_fp, src_chunks, dst_fp):
+    # type: (str, bytes, str) -> Tuple[str, bytes]
+    """
+    Compute the ISCC Data-Code of a file derived from another file with a known chunk table.
+
+    CDC cut points only depend on the bytes following the start of a chunk. Chunks of the source
+    that lie within the common prefix of both files are kept. The derived file is chunked from
+    there until a cut point meets the start of a source chunk within the common suffix, from
+    which on the remaining source chunks are reused. The result is identical to a full
+    computation.
+
+    :param str src_fp: Local filepath of the source file
+    :param bytes src_chunks: Packed chunk table of the source file (see `pack_chunks`)
+    :param str dst_fp: Local filepath of the derived file
+    :return: ISCC Data-Code and packed chunk table of the derived file
+    """
+    src_sizes, src_features = unpack_chunks(src_chunks)
+    with open(src_fp, "rb") as src_file, open(dst_fp, "rb") as dst_file:
+        if not os.fstat(src_file.fileno()).st_size or not os.fstat(dst_file.fileno()).st_size:
+            digests = hash_file(dst_fp, data=True)
+            return digests.data_code, digests.chunks
+        with mmap.mmap(src_file.fileno(), 0, access=mmap.ACCESS_READ) as src, mmap.mmap(
+            dst_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as dst:
+            sizes, features = _derive_chunks(src, src_sizes, src_features, dst)
+    return data_code_from_features(features), pack_chunks(sizes, features)
+
+
+def _derive_chunks(src, src_sizes, src_features, dst):
+    # type: (mmap.mmap, List[int], List[int], mmap.mmap) -> Tuple[List[int], List[int]]
+    mi, ma, cs, mask_s, mask_l = alg_cdc_params(ic.core_opts.data_avg_chunk_size)
+    prefix = _common_prefix(src, dst)
+    suffix = _common_suffix(src, dst, min(len(src), len(dst)) - prefix)
+    delta = len(dst) - len(src)
+    shortest = min(len(src), len(dst))
+
+    # keep source chunks within the common prefix (cut points not influenced by the file end)
+    sizes, features = [], []
+    pos = 0
+    for size, feature in zip(src_sizes, src_features):
+        if pos + size > prefix or pos + ma > shortest:
+            break
+        sizes.append(size)
+        features.append(feature)
+        pos += size
+
+    starts = {}
+    start = 0
+    for i, size in enumerate(src_sizes):
+        starts[start] = i
+        start += size
+
+    # chunk the changed region until cut points are in sync with the source again
+    sync = len(dst) - suffix
+    with memoryview(dst) as view:
+        while pos < len(dst):
+            if pos >= sync and pos - delta in starts:
+                i = starts[pos - delta]
+                sizes.extend(src_sizes[i:])
+                features.extend(src_features[i:])
+                break
+            cut = alg_cdc_offset(view[pos : pos + ma], mi, ma, cs, mask_s, mask_l)
+            cut = min(cut, len(dst) - pos)  # the offset may exceed a final chunk below minimum size
+            sizes.append(cut)
+            features.append(xxhash.xxh32_intdigest(view[pos : pos + cut]))
+            pos += cut
+    return sizes, features
+
+
+def _common_prefix(a, b, block=1024 * 1024):
+    # type: (mmap.mmap, mmap.mmap, int) -> int
+    """Length of the common prefix of two buffers."""
+    limit = min(len(a), len(b))
+    pos = 0
+    while pos < limit and a[pos : pos + block] == b[pos : pos + block]:
+        pos += block
+    pos = min(pos, limit)
+    end = min(pos + block, limit)
+    while pos < end and a[pos] == b[pos]:
+        pos += 1
+    return pos
+
+
+def _common_suffix(a, b, limit, block=1024 * 1024):
+    # type: (mmap.mmap, mmap.mmap, int) -> int
+    """Length of the common suffix of two buffers (at most `limit`)."""
+    la, lb = len(a), len(b)
+    n = 0
+    while (
+        n < limit
+        and a[max(la - n - block, la - limit) : la - n]
+        == b[max(lb - n - block, lb - limit) : lb - n]
+    ):
+        n += block
+    n = min(n, limit)
+    end = min(n + block, limit)
+    while n < end and a[la - n - 1] == b[lb - n - 1]:
+        n += 1
+    return n
@@ -0,0 +1,159 @@
+"""
+Inline ISCC generation for tiny uploads.
+
+Uploads of up to INLINE_MAX_SIZE bytes are processed within the API request instead of a worker
+task to skip the roundtrip through the task queue. The stages of the generator pipeline run on
+the database threads while the ISCC itself is generated in a local pool of INLINE_WORKERS
+processes, so the event loop stays responsive. Requests that find all inline slots busy and
+failed inline runs continue on the task queue from the last checkpoint.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+import django
+import iscc_sdk as idk
+from django.conf import settings
+from loguru import logger as log
+from iscc_generator import facts, pipeline
+from iscc_generator.base import db_sync_to_async
+from iscc_generator.hashing import Digests
+from iscc_generator.models import IsccCode, Media
+from iscc_generator.storage import remove_local_temp
+from iscc_generator.units import code_iscc
+
+
+_pool = None  # type: Optional[ProcessPoolExecutor]
+_slots = None  # type: Optional[threading.BoundedSemaphore]
+_pool_lock = threading.Lock()
+
+Stage = IsccCode.Stage
+
+
+def accepts(media_obj):
+    # type: (Optional[Media]) -> bool
+    """Whether the file of a Media object qualifies for inline processing."""
+    if media_obj is None or media_obj.size is None:
+        return False
+    return media_obj.size <= settings.INLINE_MAX_SIZE
+
+
+async def generate(iscc_obj, media_obj):
+    # type: (IsccCode, Optional[Media]) -> bool
+    """
+    Process an IsccCode object inline if its source file qualifies and a slot is free.
+
+    :param IsccCode iscc_obj: The IsccCode object
+    :param Media media_obj: The uploaded source file of the IsccCode object
+    :return: Whether processing finished (otherwise start the pipeline on the task queue)
+    """
+    if not accepts(media_obj):
+        return False
+    slots = get_slots()
+    if not slots.acquire(blocking=False):
+        return False
+    try:
+        await run_pipeline(iscc_obj)
+    except Exception as e:
+        log.warning(f"inline processing of {iscc_obj.flake} failed, fallback to task queue: {e}")
+        return False
+    finally:
+        slots.release()
+    return True
+
+
+async def run_pipeline(iscc_obj):
+    # type: (IsccCode) -> None
+    """Process all stages of the generator pipeline for an IsccCode object."""
+    stage = await db_sync_to_async(pipeline.first_stage)(iscc_obj)
+    while stage != Stage.DONE:
+        if stage == Stage.ISCC:
+            stage = await run_iscc(iscc_obj)
+        else:
+            stage = await db_sync_to_async(pipeline.run_stage)(iscc_obj, stage)
+
+
+async def run_iscc(iscc_obj):
+    # type: (IsccCode) -> str
+    """Run the ISCC stage with ISCC generation in the process pool."""
+    temp_fp, digests, metadata = await db_sync_to_async(prepare)(iscc_obj)
+    try:
+        result = await run_in_pool(generate_iscc, temp_fp, digests, metadata)
+    finally:
+        remove_local_temp(temp_fp)
+    return await db_sync_to_async(save)(iscc_obj, result)
+
+
+async def run_in_pool(func, *args):
+    """Run `func(*args)` in the process pool (once more in a new pool if the pool broke)."""
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # a worker process died (e.g. killed for memory), the pool accepts no more work
+        log.warning("inline process pool broken, restarting it")
+        reset_pool(pool)
+        return await loop.run_in_executor(get_pool(), func, *args)
+
+
+def prepare(iscc_obj):
+    # type: (IsccCode) -> Tuple[str, Digests, Optional[dict]]
+    temp_fp, digests = pipeline.prepare_iscc(iscc_obj)
+    return temp_fp, digests, iscc_obj.source_file.metadata
+
+
+def save(iscc_obj, iscc_result_obj):
+    # type: (IsccCode, idk.IsccMeta) -> str
+    return pipeline.checkpoint(iscc_obj, pipeline.save_iscc(iscc_obj, iscc_result_obj))
+
+
+def generate_iscc(fp, digests, metadata=None):
+    # type: (str, Digests, Optional[dict]) -> idk.IsccMeta
+    """
+    Generate the ISCC of a local file (runs in the process pool).
+
+    :param str fp: Local filepath
+    :param Digests digests: Digests of the file computed with Data-Code
+    :param dict metadata: Metadata stored for the file (extracted if not provided)
+    """
+    with facts.scope():
+        facts.register(fp, digests)
+        if metadata is not None:
+            known = {k: v for k, v in metadata.items() if v is not None}
+            facts.seed(facts.METADATA, fp, idk.IsccMeta.construct(**known))
+        return code_iscc(fp, digests)
+
+
+def get_pool():
+    # type: () -> ProcessPoolExecutor
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.INLINE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def reset_pool(pool):
+    # type: (ProcessPoolExecutor) -> None
+    """Discard a broken process pool (unless it was already replaced)."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def get_slots():
+    # type: () -> threading.BoundedSemaphore
+    global _slots
+    with _pool_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(settings.INLINE_WORKERS)
+        return _slots
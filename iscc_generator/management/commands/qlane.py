@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django_q.cluster import Cluster
+from django_q.conf import Conf
+from iscc_generator.queues import get_queue_broker
+
+
+RETRY_MARGIN = 100
+
+
+class Command(BaseCommand):
+    help = "Starts a Django Q Cluster consuming the task queue of a processing lane."
+
+    def add_arguments(self, parser):
+        parser.add_argument("lane", help="Name of the lane (see QUEUE_LANES) or task queue")
+        parser.add_argument("--workers", type=int, help="Number of workers (default: lane)")
+        parser.add_argument("--timeout", type=int, help="Task timeout in seconds (default: lane)")
+
+    def handle(self, *args, **options):
+        lane = options["lane"]
+        queues = set(settings.QUEUE_LANES)
+        queues.update({settings.PIPELINE_IO_CLUSTER, settings.PIPELINE_CPU_CLUSTER} - {None})
+        if lane not in queues:
+            raise CommandError(f"Unknown lane or task queue: {lane}")
+        config = settings.QUEUE_LANES.get(lane, {})
+        # the cluster name (Conf.PREFIX) is kept as it salts the signed task packages
+        workers = options["workers"] or config.get("workers")
+        if workers:
+            Conf.WORKERS = workers
+        timeout = options["timeout"] or config.get("timeout")
+        if timeout and timeout >= Conf.RETRY:
+            # tasks still running after Conf.RETRY seconds are handed out again by the broker
+            Conf.RETRY = timeout + RETRY_MARGIN
+        q = Cluster(get_queue_broker(lane))
+        if timeout:
+            q.timeout = timeout
+        q.start()
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0005_refactor_nft_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="datahash",
+            field=models.CharField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="Blake3 multihash of the file (basis for the ISCC Instance-Code)",
+                max_length=128,
+                null=True,
+                verbose_name="datahash",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0006_media_datahash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="media",
+            name="cid",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default=None,
+                help_text="IPFS CIDv1",
+                max_length=128,
+                null=True,
+                verbose_name="cid",
+            ),
+        ),
+    ]
@@ -0,0 +1,134 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0007_media_cid_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        help_text="Name of the cache",
+                        max_length=32,
+                        unique=True,
+                        verbose_name="name",
+                    ),
+                ),
+                ("hits", models.PositiveBigIntegerField(default=0, verbose_name="hits")),
+                ("misses", models.PositiveBigIntegerField(default=0, verbose_name="misses")),
+            ],
+            options={
+                "verbose_name": "Cache Statistics",
+                "verbose_name_plural": "Cache Statistics",
+            },
+        ),
+        migrations.CreateModel(
+            name="ResultCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now, editable=False, verbose_name="created"
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now, editable=False, verbose_name="modified"
+                    ),
+                ),
+                (
+                    "datahash",
+                    models.CharField(
+                        help_text="Blake3 multihash of the processed source file",
+                        max_length=128,
+                        verbose_name="datahash",
+                    ),
+                ),
+                (
+                    "metahash",
+                    models.CharField(
+                        help_text="SHA-256 of the canonical embeddable metadata",
+                        max_length=64,
+                        verbose_name="metahash",
+                    ),
+                ),
+                (
+                    "version",
+                    models.CharField(
+                        help_text="Version of iscc-sdk that created the result",
+                        max_length=32,
+                        verbose_name="version",
+                    ),
+                ),
+                (
+                    "result",
+                    models.JSONField(
+                        help_text="The cached result of the ISCC generator.", verbose_name="result"
+                    ),
+                ),
+                (
+                    "hits",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Number of times the result was served from cache",
+                        verbose_name="hits",
+                    ),
+                ),
+                (
+                    "accessed",
+                    models.DateTimeField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        help_text="Last time the result was written or served from cache",
+                        verbose_name="accessed",
+                    ),
+                ),
+                (
+                    "media",
+                    models.ForeignKey(
+                        blank=True,
+                        default=None,
+                        help_text="Media object the cached result was generated from",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="iscc_generator.media",
+                        verbose_name="media",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Result Cache Entry",
+                "verbose_name_plural": "Result Cache",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="resultcache",
+            constraint=models.UniqueConstraint(
+                fields=("datahash", "metahash", "version"), name="unique_result_cache_key"
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import iscc_generator.base
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0008_result_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IsccBatch",
+            fields=[
+                (
+                    "created",
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now, editable=False, verbose_name="created"
+                    ),
+                ),
+                (
+                    "modified",
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now, editable=False, verbose_name="modified"
+                    ),
+                ),
+                (
+                    "id",
+                    models.PositiveBigIntegerField(
+                        default=iscc_generator.base.make_flake,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "ISCC Batch",
+                "verbose_name_plural": "ISCC Batches",
+            },
+        ),
+        migrations.AddField(
+            model_name="iscccode",
+            name="task_id",
+            field=models.CharField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="ID of the background task processing this entry",
+                max_length=32,
+                null=True,
+                verbose_name="task id",
+            ),
+        ),
+        migrations.AddField(
+            model_name="iscccode",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                default=None,
+                help_text="Batch request this entry was submitted with",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="items",
+                to="iscc_generator.isccbatch",
+                verbose_name="batch",
+            ),
+        ),
+    ]
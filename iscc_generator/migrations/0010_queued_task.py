@@ -0,0 +1,49 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0009_iscc_batch"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueuedTask",
+            fields=[
+                (
+                    "id",
+                    models.CharField(
+                        editable=False,
+                        help_text="ID of the queued django-q task",
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="task id",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        editable=False,
+                        help_text="Name of the queued django-q task",
+                        max_length=100,
+                        verbose_name="name",
+                    ),
+                ),
+                (
+                    "started",
+                    models.DateTimeField(
+                        db_index=True,
+                        editable=False,
+                        help_text="Time the task was enqueued",
+                        verbose_name="started",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Queued Task",
+            },
+        ),
+    ]
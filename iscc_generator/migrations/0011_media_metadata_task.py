@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0010_queued_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="metadata_task",
+            field=models.CharField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="ID of the background task extracting the metadata",
+                max_length=32,
+                null=True,
+                verbose_name="metadata task",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0011_media_metadata_task"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="chunks",
+            field=models.BinaryField(
+                blank=True,
+                default=None,
+                help_text="CDC chunk table (sizes and features) of the ISCC Data-Code",
+                null=True,
+                verbose_name="chunks",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0012_media_chunks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="media",
+            name="cid_wrapped",
+            field=models.CharField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="IPFS CIDv1 of the file wrapped with a directory (<cid>/<filename>)",
+                max_length=512,
+                null=True,
+                verbose_name="cid wrapped",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.10 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0013_media_cid_wrapped"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="iscccode",
+            name="stage",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("fetch", "Fetch"),
+                    ("embed", "Embed"),
+                    ("iscc", "Iscc"),
+                    ("done", "Done"),
+                ],
+                default=None,
+                editable=False,
+                help_text="Next processing stage (checkpoint of the generator pipeline)",
+                max_length=8,
+                null=True,
+                verbose_name="stage",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0014_iscccode_stage"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="media",
+            name="type",
+            field=models.CharField(
+                blank=True,
+                default=None,
+                editable=False,
+                help_text="IANA Media Type (MIME type) detected from the file content",
+                max_length=255,
+                null=True,
+                verbose_name="mediatype",
+            ),
+        ),
+    ]
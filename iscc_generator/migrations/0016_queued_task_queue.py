@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+def index_queued_tasks(apps, schema_editor):
+    """Index tasks that were enqueued on the ORM broker before they were indexed on enqueue."""
+    from django_q.signing import SignedPackage
+
+    OrmQ = apps.get_model("django_q", "OrmQ")
+    QueuedTask = apps.get_model("iscc_generator", "QueuedTask")
+    for queued in OrmQ.objects.all():
+        try:
+            task = SignedPackage.loads(queued.payload)
+        except Exception:
+            # signed with another secret or cluster name or the task function is gone
+            continue
+        QueuedTask.objects.update_or_create(
+            id=task["id"],
+            defaults=dict(name=task["name"], started=task["started"], queue=queued.key),
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("iscc_generator", "0015_media_type_detected"),
+        ("django_q", "0014_schedule_cluster"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="queuedtask",
+            name="queue",
+            field=models.CharField(
+                default="",
+                editable=False,
+                help_text="Name of the task queue (processing lane or cluster)",
+                max_length=100,
+                verbose_name="queue",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="queuedtask",
+            index=models.Index(fields=["queue", "started"], name="iscc_genera_queue_d29904_idx"),
+        ),
+        migrations.RunPython(index_queued_tasks, migrations.RunPython.noop),
+    ]
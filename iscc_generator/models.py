@@ -1,16 +1,24 @@
+import json
 import os
 import shutil
 import tempfile
+from os.path import basename, dirname
+from typing import Optional
 import humanize
+from constance import config
 from loguru import logger as log
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import TemporaryUploadedFile
-from django.db import models
+from django.db import models, transaction
 from django.forms import model_to_dict
+from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import gettext_lazy as _
 from django.contrib import admin
+from model_utils.models import TimeStampedModel
 from iscc_generator.base import GeneratorBaseModel
-from iscc_generator.storage import get_storage_path
+from iscc_generator.hashing import hash_file, wrap_cid
+from iscc_generator.storage import clean_filename, get_storage_path
 import iscc_sdk as idk
 import iscc_schema as iss
 
@@ -20,6 +28,12 @@ class IsccCode(GeneratorBaseModel):
         verbose_name = "ISCC-CODE"
         verbose_name_plural = "ISCC-CODES"
 
+    class Stage(models.TextChoices):
+        FETCH = "fetch"
+        EMBED = "embed"
+        ISCC = "iscc"
+        DONE = "done"
+
     iscc = models.CharField(
         verbose_name="ISCC",
         max_length=73,
@@ -130,6 +144,38 @@ class IsccCode(GeneratorBaseModel):
         help_text=_("The result returned by the ISCC generator."),
     )
 
+    batch = models.ForeignKey(
+        "IsccBatch",
+        verbose_name=_("batch"),
+        null=True,
+        blank=True,
+        default=None,
+        on_delete=models.CASCADE,
+        related_name="items",
+        help_text=_("Batch request this entry was submitted with"),
+    )
+
+    task_id = models.CharField(
+        verbose_name=_("task id"),
+        max_length=32,
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        help_text=_("ID of the background task processing this entry"),
+    )
+
+    stage = models.CharField(
+        verbose_name=_("stage"),
+        max_length=8,
+        null=True,
+        blank=True,
+        default=None,
+        choices=Stage.choices,
+        editable=False,
+        help_text=_("Next processing stage (checkpoint of the generator pipeline)"),
+    )
+
     def __str__(self):
         if self.iscc:
             return self.iscc
@@ -159,6 +205,15 @@ class IsccCode(GeneratorBaseModel):
         return format_html(f'<span style="font-family: monospace">{self.flake}</span>')
 
 
+class IsccBatch(GeneratorBaseModel):
+    class Meta:
+        verbose_name = _("ISCC Batch")
+        verbose_name_plural = _("ISCC Batches")
+
+    def __str__(self):
+        return f"BATCH-{self.flake}"
+
+
 class Media(GeneratorBaseModel):
     class Meta:
         verbose_name = _("Media Asset")
@@ -187,9 +242,39 @@ class Media(GeneratorBaseModel):
         blank=True,
         default=None,
         max_length=128,
+        db_index=True,
         help_text=_("IPFS CIDv1"),
     )
 
+    cid_wrapped = models.CharField(
+        verbose_name=_("cid wrapped"),
+        null=True,
+        blank=True,
+        default=None,
+        max_length=512,
+        editable=False,
+        help_text=_("IPFS CIDv1 of the file wrapped with a directory (<cid>/<filename>)"),
+    )
+
+    datahash = models.CharField(
+        verbose_name=_("datahash"),
+        null=True,
+        blank=True,
+        default=None,
+        max_length=128,
+        editable=False,
+        help_text=_("Blake3 multihash of the file (basis for the ISCC Instance-Code)"),
+    )
+
+    chunks = models.BinaryField(
+        verbose_name=_("chunks"),
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        help_text=_("CDC chunk table (sizes and features) of the ISCC Data-Code"),
+    )
+
     type = models.CharField(
         verbose_name=_("mediatype"),
         null=True,
@@ -197,7 +282,7 @@ class Media(GeneratorBaseModel):
         default=None,
         max_length=255,
         editable=False,
-        help_text=_("Original IANA Media Type (MIME type) from upload (untrusted)"),
+        help_text=_("IANA Media Type (MIME type) detected from the file content"),
     )
     size = models.PositiveBigIntegerField(
         verbose_name=_("filesize"),
@@ -214,6 +299,16 @@ class Media(GeneratorBaseModel):
         help_text=_("Metadata embedded in the file"),
     )
 
+    metadata_task = models.CharField(
+        verbose_name=_("metadata task"),
+        max_length=32,
+        null=True,
+        blank=True,
+        default=None,
+        editable=False,
+        help_text=_("ID of the background task extracting the metadata"),
+    )
+
     original = models.ForeignKey(
         "self",
         verbose_name=_("original"),
@@ -231,11 +326,68 @@ class Media(GeneratorBaseModel):
         if self.size:
             return humanize.naturalsize(self.size, binary=True)
 
+    @property
+    def filename(self):
+        # type: () -> str
+        """Filename used for local processing of the media asset."""
+        if self.name and dirname(self.source_file.name) != self.flake:
+            # Deduplicated file stored under the folder of another Media object
+            return default_storage.get_valid_name(clean_filename(self.name))
+        return basename(self.source_file.name)
+
+    @classmethod
+    def find_duplicate(cls, cid):
+        # type: (str) -> Optional[Media]
+        """
+        Find the earliest stored Media object with identical content.
+
+        Only rows with a committed `source_file` are considered, so a concurrent upload of the
+        same content can never be matched before its file has been stored.
+
+        :param str cid: IPFS CIDv1 of the content
+        :return: Media object with identical content or None
+        """
+        if not cid or not config.MEDIA_DEDUP:
+            return None
+        return (
+            cls.objects.filter(cid=cid)
+            .exclude(source_file="")
+            .exclude(source_file__isnull=True)
+            .order_by("id")
+            .first()
+        )
+
+    def extract_metadata(self, fp, mode=None):
+        # type: (str, Optional[str]) -> None
+        """Extract embedded metadata from the local file at `fp`."""
+        if mode is None:
+            mt, mode = idk.mediatype_and_mode(fp)
+        if mode == "audio":
+            # taglib can´t read metadata from a filepath of an opened TemporaryUploadedFile
+            tdir = tempfile.mkdtemp()
+            tfp = shutil.copy(fp, tdir)
+            self.metadata = idk.extract_metadata(tfp).dict(exclude_unset=False)
+            os.remove(tfp)
+        else:
+            self.metadata = idk.extract_metadata(fp).dict(exclude_unset=False)
+
+    def has_metadata(self, meta):
+        # type: (iss.IsccMeta) -> bool
+        """Whether the extracted metadata of the file already has all values set in `meta`."""
+        if self.metadata is None:
+            return False
+        values = json.loads(meta.json(exclude_unset=True, exclude_none=True))
+        return all(self.metadata.get(key) == value for key, value in values.items())
+
     def save(self, *args, **kwargs):
         """
         Intercept new file uploads.
 
-        Extract metadata before `source_file` eventually ends up in remote storage.
+        Extract metadata before `source_file` eventually ends up in remote storage. Hashes are
+        taken from the `digests` computed by the upload handler while the upload was received.
+        If identical content is already stored, the stored file and its metadata are reused.
+        The wrapped IPFS CID is derived from the hashes once the filename is known.
+        With DEFER_MEDIA_METADATA enabled metadata extraction is left to a worker task.
         """
         new_upload = False
         try:
@@ -247,20 +399,40 @@ class Media(GeneratorBaseModel):
         if new_upload:
             self.source_file.file.flush()
             self.name = self.source_file.file.name
-            self.type = self.source_file.file.content_type
-            self.size = self.source_file.size
             fp = self.source_file.file.temporary_file_path()
-            self.cid = idk.ipfs_cidv1(fp)
+            digests = getattr(self.source_file.file, "digests", None) or hash_file(fp)
+            self.size = digests.size
+            self.cid = digests.cid
+            self.datahash = digests.datahash
+            self.digests = digests
             mt, mode = idk.mediatype_and_mode(fp)
-            if mode == "audio":
-                # taglib can´t read metadata from a filepath of an opened TemporaryUploadedFile
-                tdir = tempfile.mkdtemp()
-                tfp = shutil.copy(fp, tdir)
-                self.metadata = idk.extract_metadata(tfp).dict(exclude_unset=False)
-                os.remove(tfp)
-            else:
-                self.metadata = idk.extract_metadata(fp).dict(exclude_unset=False)
+            self.type = mt
+            duplicate = Media.find_duplicate(self.cid)
+            if duplicate:
+                self.source_file = duplicate.source_file.name
+                self.metadata = duplicate.metadata
+            elif not config.DEFER_MEDIA_METADATA:
+                self.extract_metadata(fp, mode)
         super().save(*args, **kwargs)
+        digests = getattr(self, "digests", None)
+        if digests and digests.ipfs_root and not self.cid_wrapped and self.source_file:
+            # wrapped CIDs depend on the final filename which is known after saving the file
+            self.cid_wrapped = wrap_cid(digests.ipfs_root, clean_filename(self.filename))
+            Media.objects.filter(pk=self.pk).update(cid_wrapped=self.cid_wrapped)
+        if new_upload and self.metadata is None:
+            pk = self.pk
+            transaction.on_commit(lambda: Media.enqueue_metadata_task(pk))
+
+    @staticmethod
+    def enqueue_metadata_task(pk):
+        # type: (int) -> str
+        """Start metadata extraction for the Media object with `pk` in a worker."""
+        from iscc_generator.queues import enqueue_task, media_lane
+
+        lane = media_lane(Media.objects.filter(pk=pk).first())
+        task_id = enqueue_task("iscc_generator.tasks.media_metadata_task", pk, lane=lane)
+        Media.objects.filter(pk=pk).update(metadata_task=task_id)
+        return task_id
 
 
 class Nft(GeneratorBaseModel):
@@ -383,3 +555,137 @@ class Nft(GeneratorBaseModel):
 
     def __str__(self):
         return f"NFT-{self.flake}"
+
+
+class ResultCache(TimeStampedModel):
+    class Meta:
+        verbose_name = _("Result Cache Entry")
+        verbose_name_plural = _("Result Cache")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["datahash", "metahash", "version"], name="unique_result_cache_key"
+            )
+        ]
+
+    datahash = models.CharField(
+        verbose_name=_("datahash"),
+        max_length=128,
+        help_text=_("Blake3 multihash of the processed source file"),
+    )
+
+    metahash = models.CharField(
+        verbose_name=_("metahash"),
+        max_length=64,
+        help_text=_("SHA-256 of the canonical embeddable metadata"),
+    )
+
+    version = models.CharField(
+        verbose_name=_("version"),
+        max_length=32,
+        help_text=_("Version of iscc-sdk that created the result"),
+    )
+
+    media = models.ForeignKey(
+        Media,
+        verbose_name=_("media"),
+        null=True,
+        blank=True,
+        default=None,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        help_text=_("Media object the cached result was generated from"),
+    )
+
+    result = models.JSONField(
+        verbose_name=_("result"),
+        help_text=_("The cached result of the ISCC generator."),
+    )
+
+    hits = models.PositiveIntegerField(
+        verbose_name=_("hits"),
+        default=0,
+        help_text=_("Number of times the result was served from cache"),
+    )
+
+    accessed = models.DateTimeField(
+        verbose_name=_("accessed"),
+        default=timezone.now,
+        db_index=True,
+        help_text=_("Last time the result was written or served from cache"),
+    )
+
+    def __str__(self):
+        return self.result.get("iscc", "")
+
+
+class CacheStats(models.Model):
+    class Meta:
+        verbose_name = _("Cache Statistics")
+        verbose_name_plural = _("Cache Statistics")
+
+    name = models.CharField(
+        verbose_name=_("name"),
+        max_length=32,
+        unique=True,
+        help_text=_("Name of the cache"),
+    )
+
+    hits = models.PositiveBigIntegerField(verbose_name=_("hits"), default=0)
+
+    misses = models.PositiveBigIntegerField(verbose_name=_("misses"), default=0)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    @admin.display(description="hit ratio")
+    def ratio(self):
+        # type: () -> float
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+
+class QueuedTask(models.Model):
+    class Meta:
+        verbose_name = _("Queued Task")
+        indexes = [models.Index(fields=["queue", "started"])]
+
+    id = models.CharField(
+        verbose_name=_("task id"),
+        max_length=32,
+        primary_key=True,
+        editable=False,
+        help_text=_("ID of the queued django-q task"),
+    )
+
+    name = models.CharField(
+        verbose_name=_("name"),
+        max_length=100,
+        editable=False,
+        help_text=_("Name of the queued django-q task"),
+    )
+
+    started = models.DateTimeField(
+        verbose_name=_("started"),
+        db_index=True,
+        editable=False,
+        help_text=_("Time the task was enqueued"),
+    )
+
+    queue = models.CharField(
+        verbose_name=_("queue"),
+        max_length=100,
+        default="",
+        editable=False,
+        help_text=_("Name of the task queue (processing lane or cluster)"),
+    )
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def queue_position(self):
+        # type: () -> int
+        """Position of the task in its queue (1 = next to be processed)."""
+        queued = QueuedTask.objects.filter(queue=self.queue, started__lt=self.started)
+        return queued.count() + 1
@@ -0,0 +1,168 @@
+"""
+Task completion notifications.
+
+Workers signal finished tasks via Postgres NOTIFY. API processes LISTEN on a dedicated connection
+and resolve waiting requests from within the event loop. Tasks finished in the same process
+(sync mode) are dispatched in-process. Without Postgres a slow poll is used as safety net for
+tasks finished by other processes.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django_q.models import Task
+from iscc_generator.base import db_sync_to_async
+from loguru import logger as log
+
+
+CHANNEL = "iscc_generator_task_done"
+
+_lock = threading.Lock()
+_waiters = defaultdict(
+    list
+)  # type: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]]
+_listeners = {}  # type: Dict[asyncio.AbstractEventLoop, asyncio.Task]
+_retry_at = {}  # type: Dict[asyncio.AbstractEventLoop, float]
+
+
+def task_saved(sender, instance, **kwargs):
+    """Signal receiver for django-q Task objects (results are saved when a task is done)."""
+    task_id = instance.id
+    transaction.on_commit(lambda: notify_task_done(task_id))
+
+
+def notify_task_done(task_id):
+    # type: (str) -> None
+    """Notify all processes waiting for the task with `task_id`."""
+    if connection.vendor == "postgresql":
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, task_id])
+        except Exception as e:
+            log.error(f"failed to notify completion of task {task_id}: {e}")
+    dispatch(task_id)
+
+
+def dispatch(task_id):
+    # type: (str) -> None
+    """Resolve in-process waiters for `task_id` (thread-safe)."""
+    with _lock:
+        waiters = _waiters.get(task_id, [])
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    # type: (asyncio.Future) -> None
+    if not future.done():
+        future.set_result(True)
+
+
+class PgListener:
+    """LISTEN for task notifications on a dedicated Postgres connection."""
+
+    def __init__(self, loop):
+        # type: (asyncio.AbstractEventLoop) -> None
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        self.loop = loop
+        self.conn = psycopg2.connect(**connection.get_connection_params())
+        self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL};")
+        loop.add_reader(self.conn.fileno(), self.on_readable)
+
+    def on_readable(self):
+        try:
+            self.conn.poll()
+        except Exception as e:
+            log.error(f"task notification listener failed: {e}")
+            self.close()
+            return
+        while self.conn.notifies:
+            notification = self.conn.notifies.pop(0)
+            dispatch(notification.payload)
+
+    def close(self):
+        self.loop.remove_reader(self.conn.fileno())
+        _listeners.pop(self.loop, None)
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+async def get_listener():
+    # type: () -> Optional[PgListener]
+    """Return the notification listener of the running event loop (None if unavailable)."""
+    if connection.vendor != "postgresql":
+        return None
+    loop = asyncio.get_running_loop()
+    if loop not in _listeners:
+        if loop.time() < _retry_at.get(loop, 0.0):
+            return None
+        # concurrent first callers share the same connection attempt
+        _listeners[loop] = loop.create_task(connect_listener(loop))
+    return await asyncio.shield(_listeners[loop])
+
+
+async def connect_listener(loop):
+    # type: (asyncio.AbstractEventLoop) -> Optional[PgListener]
+    """Set up the listener for `loop`. On failure retry after `TASK_LISTEN_RETRY` seconds."""
+    try:
+        listener = await sync_to_async(PgListener)(loop)
+    except Exception as e:
+        log.error(f"failed to listen for task notifications: {e}")
+        _listeners.pop(loop, None)
+        _retry_at[loop] = loop.time() + settings.TASK_LISTEN_RETRY
+        return None
+    _retry_at.pop(loop, None)
+    return listener
+
+
+@db_sync_to_async
+def task_result(task_id):
+    # type: (str) -> Tuple[bool, Any]
+    """Returns whether the task is done and its result."""
+    task = Task.objects.filter(id=task_id).only("result").first()
+    if task is None:
+        return False, None
+    return True, task.result
+
+
+async def wait_for_task(task_id, timeout):
+    # type: (str, float) -> Any
+    """
+    Wait until the task with `task_id` is done.
+
+    :param str task_id: ID of the django-q task
+    :param float timeout: Maximum number of seconds to wait
+    :return: The result of the task or None if it is not done in time
+    """
+    loop = asyncio.get_running_loop()
+    listener = await get_listener()
+    interval = timeout if listener else settings.TASK_POLL_INTERVAL
+    deadline = loop.time() + timeout
+    while True:
+        waiter = (loop, loop.create_future())
+        with _lock:
+            _waiters[task_id].append(waiter)
+        try:
+            # check first: the task may have finished before we started waiting
+            done, result = await task_result(task_id)
+            remaining = deadline - loop.time()
+            if done or remaining <= 0:
+                return result
+            try:
+                await asyncio.wait_for(waiter[1], min(interval, remaining))
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            with _lock:
+                _waiters[task_id].remove(waiter)
+                if not _waiters[task_id]:
+                    del _waiters[task_id]
@@ -0,0 +1,331 @@
+"""
+Staged ISCC generation pipeline.
+
+ISCC generation runs in stages (fetch -> embed -> iscc). Each stage checkpoints its outcome in
+stored Media objects and the `stage` field of the IsccCode object, so processing resumes at the
+failed stage instead of starting over. Stages declare the worker pool they belong to (I/O or CPU
+bound), a timeout and a retry policy for transient errors.
+
+In queued mode (`start_pipeline`) every stage is a separate worker task. Stages on a source file
+run in the processing lane of the file (see QUEUE_LANES), otherwise on the task queue of their
+pool (see PIPELINE_IO_CLUSTER and PIPELINE_CPU_CLUSTER). A stage task that hands over to
+the next stage returns `dict(next=<task_id>)`. `run_pipeline` processes all stages inline.
+"""
+import json
+from typing import Callable, NamedTuple, Optional, Tuple, Type
+import httpx
+import iscc_core as ic
+import iscc_schema as iss
+import iscc_sdk as idk
+from data_url import DataURL
+from django.conf import settings
+from loguru import logger as log
+from iscc_generator import facts
+from iscc_generator.cache import metadata_hash, result_cache_get, result_cache_set
+from iscc_generator.download import cache_media, download_media, download_url
+from iscc_generator.hashing import Digests, hash_file, restore_digests
+from iscc_generator.models import IsccCode, Media
+from iscc_generator.queues import enqueue_task, media_lane
+from iscc_generator.storage import (
+    clean_filename,
+    derived_media_obj_from_path,
+    media_obj_from_path,
+    remove_local_temp,
+)
+from iscc_generator.units import code_iscc
+
+
+IO = "io"
+CPU = "cpu"
+
+STAGE_TASK = "iscc_generator.pipeline.stage_task"
+
+Stage = IsccCode.Stage
+
+
+class StagePolicy(NamedTuple):
+    func: Callable[[IsccCode], str]
+    pool: str
+    timeout: int
+    retries: int
+    retry_on: Tuple[Type[Exception], ...]
+
+
+def user_metadata(iscc_obj):
+    # type: (IsccCode) -> Tuple[iss.IsccMeta, bool]
+    """
+    Prepare the user provided metadata of an IsccCode object for embedding.
+
+    :return: Embeddable metadata and whether there is any
+    """
+    meta = iscc_obj.get_metadata()
+    embed = bool(meta.dict(exclude_unset=True))
+    if embed:
+        # ensure IsccMeta.meta is a data url for embedding
+        if iscc_obj.meta and not iscc_obj.meta.startswith("data:"):
+            data = json.loads(iscc_obj.meta)
+            serialized = ic.json_canonical(data)
+            durl_obj = DataURL.from_data("application/json", base64_encode=True, data=serialized)
+            meta.meta = durl_obj.url
+        else:
+            meta.meta = iscc_obj.meta
+    return meta, embed
+
+
+def result_metahash(meta, media_obj):
+    # type: (iss.IsccMeta, Media) -> str
+    """
+    Result cache key of the user metadata `meta` for the source file of `media_obj`.
+
+    Without a user provided name the Meta-Code falls back to a name derived from the filename
+    (see `units.code_meta`) unless the file has one, so the filename is part of the key.
+    """
+    if meta.name:
+        return metadata_hash(meta)
+    # same local filename as used for ISCC generation (see `download_media`)
+    return metadata_hash(meta, idk.text_name_from_uri(clean_filename(media_obj.filename)))
+
+
+def fetch(iscc_obj):
+    # type: (IsccCode) -> str
+    """
+    Retrieve and store the source file (I/O bound).
+
+    Completes the IsccCode object from the result cache if the same content was processed with
+    the same metadata before.
+    """
+    meta, has_meta = user_metadata(iscc_obj)
+    media_obj = iscc_obj.source_file
+    if media_obj and media_obj.datahash:
+        # serve from cache without retrieving the file
+        if iscc_result_from_cache(iscc_obj, media_obj, meta):
+            return Stage.DONE
+    if media_obj is None:
+        if not iscc_obj.source_url:
+            raise ValueError("Need at least source_file or source_url.")
+        temp_fp = download_url(iscc_obj.source_url)
+        try:
+            media_obj = media_obj_from_path(temp_fp, data=True)
+            cache_media(media_obj, temp_fp)
+        finally:
+            remove_local_temp(temp_fp)
+        iscc_obj.source_file = media_obj
+        iscc_obj.save(update_fields=["source_file"])
+        if iscc_result_from_cache(iscc_obj, media_obj, meta):
+            return Stage.DONE
+    if has_meta and not media_obj.has_metadata(meta):
+        return Stage.EMBED
+    # the file already carries the user provided metadata (e.g. a resubmission)
+    return Stage.ISCC
+
+
+def embed(iscc_obj):
+    # type: (IsccCode) -> str
+    """Embed user provided metadata and store the derived file (CPU bound)."""
+    meta, _ = user_metadata(iscc_obj)
+    media_obj = iscc_obj.source_file
+    temp_fp = download_media(media_obj)
+    try:
+        embed_fp = facts.embed_metadata(temp_fp, meta)
+        if embed_fp:
+            try:
+                media_obj = derived_media_obj_from_path(
+                    embed_fp, media_obj, temp_fp, meta, data=True
+                )
+                cache_media(media_obj, embed_fp)
+            finally:
+                remove_local_temp(embed_fp)
+            iscc_obj.source_file = media_obj
+            iscc_obj.save(update_fields=["source_file"])
+    finally:
+        remove_local_temp(temp_fp)
+    return Stage.ISCC
+
+
+def iscc(iscc_obj):
+    # type: (IsccCode) -> str
+    """Generate the ISCC of the (derived) source file and save the result (CPU bound)."""
+    temp_fp, digests = prepare_iscc(iscc_obj)
+    try:
+        iscc_result_obj = code_iscc(temp_fp, digests)
+    finally:
+        remove_local_temp(temp_fp)
+    return save_iscc(iscc_obj, iscc_result_obj)
+
+
+def prepare_iscc(iscc_obj):
+    # type: (IsccCode) -> Tuple[str, Digests]
+    """
+    Retrieve the (derived) source file with its Digests for ISCC generation.
+
+    :return: Local temp filepath (to be removed by the caller) and Digests with Data-Code
+    """
+    media_obj = iscc_obj.source_file
+    temp_fp = download_media(media_obj)
+    try:
+        if media_obj.chunks is not None and media_obj.datahash and media_obj.size is not None:
+            # Data-Code and Instance-Code from the hashes persisted by earlier stages
+            digests = restore_digests(
+                media_obj.cid, media_obj.datahash, media_obj.size, bytes(media_obj.chunks)
+            )
+        else:
+            digests = hash_file(temp_fp, data=True)
+            # persist chunk table for incremental Data-Codes of future derivatives
+            media_obj.chunks = digests.chunks
+            Media.objects.filter(pk=media_obj.pk).update(chunks=digests.chunks)
+    except Exception:
+        remove_local_temp(temp_fp)
+        raise
+    return temp_fp, digests
+
+
+def save_iscc(iscc_obj, iscc_result_obj):
+    # type: (IsccCode, iss.IsccMeta) -> str
+    """Save the generated ISCC metadata and add it to the result cache."""
+    meta, has_meta = user_metadata(iscc_obj)
+    media_obj = iscc_obj.source_file
+    # Set media_id
+    iscc_result_obj.media_id = media_obj.flake
+
+    iscc_obj.iscc = iscc_result_obj.iscc
+    iscc_obj.result = iscc_result_obj.dict(by_alias=True, exclude_none=True, exclude_unset=False)
+    iscc_obj.save(update_fields=["iscc", "result"])
+    # results of embedded files are cached for the file they were derived from
+    source_media_obj = media_obj.original if has_meta and media_obj.original else media_obj
+    if source_media_obj.datahash:
+        metahash = result_metahash(meta, source_media_obj)
+        result_cache_set(source_media_obj.datahash, metahash, iscc_obj.result, media_obj)
+    return Stage.DONE
+
+
+STAGES = {
+    Stage.FETCH: StagePolicy(
+        fetch, IO, timeout=900, retries=3, retry_on=(httpx.TransportError, OSError)
+    ),
+    Stage.EMBED: StagePolicy(embed, CPU, timeout=900, retries=1, retry_on=(OSError,)),
+    Stage.ISCC: StagePolicy(iscc, CPU, timeout=3600, retries=1, retry_on=(OSError,)),
+}
+
+
+def iscc_result_from_cache(iscc_obj, media_obj, meta):
+    # type: (IsccCode, Media, iss.IsccMeta) -> bool
+    """
+    Complete an IsccCode object from the result cache.
+
+    :param IsccCode iscc_obj: The IsccCode object to be completed
+    :param Media media_obj: The Media object with the source file
+    :param IsccMeta meta: The user provided metadata
+    :return: Whether the result was served from cache
+    """
+    entry = result_cache_get(media_obj.datahash, result_metahash(meta, media_obj))
+    if entry is None:
+        return False
+    result = dict(entry.result)
+    if entry.media.datahash == media_obj.datahash:
+        # no metadata was embedded, the result belongs to the source file itself
+        result_media_obj = media_obj
+    else:
+        result_media_obj = entry.media
+    result["media_id"] = result_media_obj.flake
+    result["filename"] = media_obj.filename
+    iscc_obj.source_file = result_media_obj
+    iscc_obj.iscc = result["iscc"]
+    iscc_obj.result = result
+    iscc_obj.save(update_fields=["source_file", "iscc", "result"])
+    return True
+
+
+def first_stage(iscc_obj):
+    # type: (IsccCode) -> str
+    """Stage to resume from (finished pipelines are started over)."""
+    if iscc_obj.stage in STAGES:
+        return iscc_obj.stage
+    return Stage.FETCH
+
+
+def run_stage(iscc_obj, stage):
+    # type: (IsccCode, str) -> str
+    """Run a single stage and checkpoint the stage that follows."""
+    return checkpoint(iscc_obj, STAGES[stage].func(iscc_obj))
+
+
+def checkpoint(iscc_obj, stage):
+    # type: (IsccCode, str) -> str
+    """Record the stage to resume processing of an IsccCode object from."""
+    iscc_obj.stage = stage
+    IsccCode.objects.filter(pk=iscc_obj.pk).update(stage=stage)
+    return stage
+
+
+def run_pipeline(pk):
+    # type: (int) -> IsccCode
+    """Process all stages for the IsccCode object with `pk` inline."""
+    iscc_obj = IsccCode.objects.get(pk=pk)
+    stage = first_stage(iscc_obj)
+    while stage != Stage.DONE:
+        stage = run_stage(iscc_obj, stage)
+    return iscc_obj
+
+
+def start_pipeline(iscc_obj, group=None):
+    # type: (IsccCode, Optional[str]) -> str
+    """
+    Enqueue processing of an IsccCode object at the stage it stopped at.
+
+    :param IsccCode iscc_obj: The IsccCode object
+    :param str group: Optional django-q task group for all stage tasks
+    :return: ID of the first stage task
+    """
+    stage = first_stage(iscc_obj)
+    IsccCode.objects.filter(pk=iscc_obj.pk).update(stage=stage)
+    return enqueue_stage(iscc_obj.pk, stage, group)
+
+
+def enqueue_stage(pk, stage, group=None, attempt=1):
+    # type: (int, str, Optional[str], int) -> str
+    """Enqueue a stage task on the lane of the source file or of its pool (see `task_enqueued`)."""
+    policy = STAGES[stage]
+    lane = media_lane(Media.objects.filter(iscc_codes__pk=pk).first())
+    if lane is None:
+        lane = settings.PIPELINE_IO_CLUSTER if policy.pool == IO else settings.PIPELINE_CPU_CLUSTER
+    options = dict(group=group) if group else {}
+    return enqueue_task(
+        STAGE_TASK, pk, stage, group, attempt, lane=lane, timeout=policy.timeout, **options
+    )
+
+
+def task_enqueued(sender, task, **kwargs):
+    """Signal receiver that records the current stage task on the IsccCode object."""
+    if task.get("func") == STAGE_TASK:
+        # recorded before the task is queued (or executed in sync mode)
+        IsccCode.objects.filter(pk=task["args"][0]).update(task_id=task["id"])
+
+
+@facts.scoped
+def stage_task(pk, stage, group=None, attempt=1):
+    # type: (int, str, Optional[str], int) -> dict
+    """
+    Worker task running one pipeline stage and enqueueing the next.
+
+    Transient errors (see `StagePolicy.retry_on`) re-enqueue the stage until its retries are used
+    up. Results of earlier stages are kept.
+
+    :param int pk: Primary key of the IsccCode entry
+    :param str stage: The stage to run
+    :param str group: Task group of the pipeline
+    :param int attempt: Number of the attempt for this stage
+    :return: The ISCC if processing is done or the task id of the next stage
+    :rtype: dict
+    """
+    iscc_obj = IsccCode.objects.get(pk=pk)
+    policy = STAGES[stage]
+    try:
+        next_stage = run_stage(iscc_obj, stage)
+    except policy.retry_on as e:
+        if attempt > policy.retries:
+            raise
+        log.warning(f"stage {stage} of {iscc_obj.flake} failed (attempt {attempt}): {e}")
+        return dict(next=enqueue_stage(pk, stage, group, attempt + 1))
+    if next_stage == Stage.DONE:
+        return dict(result=iscc_obj.iscc)
+    return dict(next=enqueue_stage(pk, next_stage, group))
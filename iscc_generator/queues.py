@@ -0,0 +1,116 @@
+"""Task queue bookkeeping."""
+from contextvars import ContextVar
+from typing import Dict, Optional
+import iscc_sdk as idk
+from django.conf import settings
+from django.db import transaction
+from django_q.brokers import Broker, get_broker
+from django_q.conf import Conf
+from django_q.tasks import async_task
+from iscc_generator.models import Media, QueuedTask
+
+
+# name of the task queue `enqueue_task` puts a task on (the broker is not passed to signals)
+_enqueue_queue = ContextVar("iscc_generator_enqueue_queue", default=None)
+
+
+def task_enqueued(sender, task, **kwargs):
+    """Signal receiver that indexes a task when it is put on the queue."""
+    queue = _enqueue_queue.get() or Conf.PREFIX
+    QueuedTask.objects.update_or_create(
+        id=task["id"], defaults=dict(name=task["name"], started=task["started"], queue=queue)
+    )
+
+
+def task_dequeued(sender, task, **kwargs):
+    """Signal receiver that removes a task from the index when a worker starts processing it."""
+    QueuedTask.objects.filter(id=task["id"]).delete()
+
+
+def task_saved(sender, instance, **kwargs):
+    """Signal receiver that removes a task from the index when its result is saved."""
+    task_id = instance.id
+    transaction.on_commit(lambda: QueuedTask.objects.filter(id=task_id).delete())
+
+
+def find_queued_task(task_id):
+    # type: (str) -> Optional[QueuedTask]
+    """Lookup a queued task by ID (constant time, no unpickling of the queue)."""
+    return QueuedTask.objects.filter(id=task_id).first()
+
+
+def get_queue_broker(cluster=None):
+    # type: (Optional[str]) -> Broker
+    """Broker for the task queue named `cluster` (default: the queue of Q_CLUSTER)."""
+    return get_broker(cluster) if cluster else get_broker()
+
+
+def select_lane(size=None, mediatype=None):
+    # type: (Optional[int], Optional[str]) -> Optional[str]
+    """
+    Select the processing lane (see QUEUE_LANES) for media of `size` and `mediatype`.
+
+    :param int size: Filesize in bytes (unknown sizes only match lanes without `max_size`)
+    :param str mediatype: Sniffed IANA Media Type
+    :return: Name of the first matching lane or None for the default queue
+    """
+    mode = None
+    if mediatype:
+        try:
+            mode = idk.mediatype_to_mode(mediatype)
+        except Exception:
+            pass
+    for name, lane in settings.QUEUE_LANES.items():
+        max_size = lane.get("max_size")
+        if max_size is not None and (size is None or size > max_size):
+            continue
+        modes = lane.get("modes")
+        if modes and mode not in modes:
+            continue
+        return name
+
+
+def media_lane(media_obj):
+    # type: (Optional[Media]) -> Optional[str]
+    """Processing lane for tasks working on the file of a Media object."""
+    if media_obj is None:
+        return None
+    return select_lane(media_obj.size, media_obj.type)
+
+
+def lane_options(lane, timeout=None):
+    # type: (Optional[str], Optional[int]) -> dict
+    """
+    Keyword arguments for `async_task` to enqueue a task on `lane`.
+
+    :param str lane: Name of the lane or task queue (None for the default queue)
+    :param int timeout: Task timeout if the lane does not set one
+    """
+    options = dict(broker=get_queue_broker(lane))
+    timeout = settings.QUEUE_LANES.get(lane, {}).get("timeout") or timeout
+    if timeout:
+        options["timeout"] = timeout
+    return options
+
+
+def enqueue_task(func, *args, lane=None, timeout=None, **kwargs):
+    """
+    Enqueue a task on `lane` with `async_task` (see `lane_options`).
+
+    :param str lane: Name of the lane or task queue (None for the default queue)
+    :param int timeout: Task timeout if the lane does not set one
+    :return: The task id
+    """
+    options = lane_options(lane, timeout)
+    options.update(kwargs)
+    token = _enqueue_queue.set(lane or Conf.PREFIX)
+    try:
+        return async_task(func, *args, **options)
+    finally:
+        _enqueue_queue.reset(token)
+
+
+def queue_depths():
+    # type: () -> Dict[str, int]
+    """Number of queued tasks per processing lane."""
+    return {name: get_queue_broker(name).queue_size() for name in settings.QUEUE_LANES}
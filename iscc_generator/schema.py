@@ -1,7 +1,8 @@
-from typing import Dict
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import AnyUrl, BaseModel, Field
 from ninja import ModelSchema, Schema
 from iscc_generator.models import Nft
+from iscc_generator.codegen.spec import MediaEmbeddedMetadata
 from iscc_generator.codegen.spec import NftPackage as BaseNftPackage
 import iscc_schema as iss
 
@@ -36,3 +37,46 @@ class QueuedTasks(Schema):
     """Number of tasks in the task queue."""
 
     queued_tasks: int
+    lanes: Dict[str, int] = Field(
+        default_factory=dict, description="Number of queued tasks per processing lane"
+    )
+
+
+class CacheStatsSchema(Schema):
+    """Hit and miss counters of a cache."""
+
+    name: str
+    hits: int
+    misses: int
+    ratio: float
+
+
+class IsccBatchPostRequest(MediaEmbeddedMetadata):
+    """Metadata and URLs for a batch of ISCC-CODEs."""
+
+    source_urls: List[AnyUrl] = Field(
+        [],
+        description="URLs of files used for generating ISCC-CODEs.",
+        example=["https://picsum.photos/200/300.jpg"],
+    )
+
+
+class IsccBatchItem(Schema):
+    """Processing status of a single ISCC-CODE in a batch."""
+
+    id: str = Field(..., description="ID of the batch item")
+    source: Optional[str] = Field(None, description="Filename or URL of the item")
+    status: str = Field(..., description="One of `queued`, `done` or `failed`")
+    iscc: Optional[str] = Field(None, description="ISCC-CODE if processing is done")
+    result: Optional[dict] = Field(None, description="ISCC Metadata if processing is done")
+    error: Optional[str] = Field(None, description="Error message if processing failed")
+
+
+class IsccBatchResponse(Schema):
+    """Processing status of a batch of ISCC-CODEs."""
+
+    batch_id: str
+    total: int
+    done: int
+    failed: int
+    items: List[IsccBatchItem]
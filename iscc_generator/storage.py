@@ -1,11 +1,15 @@
 """Storage related functions."""
 from io import BytesIO
-from os.path import basename, getsize, join
+from os.path import basename, dirname, join
+import shutil
 import tempfile
+from typing import Optional
 import translitcodec
 from django.core.files.storage import Storage, default_storage
 from pathvalidate import sanitize_filename
-import iscc_sdk as idk
+from iscc_generator import facts
+from iscc_generator.hashing import derive_data_code, hash_file
+import iscc_schema as iss
 
 
 def get_storage_path(instance, filename) -> str:
@@ -20,31 +24,125 @@ def clean_filename(filename: str) -> str:
     return sanitize_filename(filename)
 
 
-def media_obj_from_path(fp: str, original=None):
-    # type: (str, Optional["Media"]) -> "Media"
+def media_obj_from_path(fp: str, original=None, data=False):
+    # type: (str, Optional["Media"], bool) -> "Media"
     """
     Create a media object from a filepath.
 
     Create a Media object in the database, sets file properties and uploads file to storage backend.
+    If a file with identical content is already stored, it is reused instead of uploaded again.
+    The Digests of the file are attached to the returned object as `digests` for reuse.
 
     :param str fp: Local filepath of media file
     :param Optional[Media] original: Optional original Media object to be referenced.
+    :param bool data: Also compute the ISCC Data-Code while hashing the file
     """
+    media_obj = new_media_obj(fp, original, data)
+    media_obj.type, _ = facts.mediatype_and_mode(fp)
+    return store_media_obj(media_obj, fp)
+
+
+def derived_media_obj_from_path(fp, original, source_fp, meta, data=False):
+    # type: (str, "Media", str, iss.IsccMeta, bool) -> "Media"
+    """
+    Create a media object for a file derived from `original` by embedding `meta`.
+
+    The mediatype is inherited from the source file. Its stored metadata is merged with the
+    embedded metadata as far as the embedder of the mode preserves it (see
+    `facts.embedded_metadata`), otherwise metadata is extracted from the derived file. The
+    Data-Code is derived from the chunk table of the original for the changed regions only.
+
+    :param str fp: Local filepath of the derived media file
+    :param Media original: Media object the file was derived from
+    :param str source_fp: Local filepath of the file of `original`
+    :param IsccMeta meta: The metadata that was embedded
+    :param bool data: Also compute the ISCC Data-Code while hashing the file
+    """
+    media_obj = new_media_obj(fp, original)
+    if data:
+        data_code, chunks = derive_data_code(source_fp, chunk_table(original, source_fp), fp)
+        media_obj.digests = media_obj.digests._replace(data_code=data_code, chunks=chunks)
+        media_obj.chunks = chunks
+        facts.register(fp, media_obj.digests)
+    mediatype, mode = facts.mediatype_and_mode(source_fp)
+    media_obj.type = mediatype
+    facts.seed(facts.MEDIATYPE, fp, (mediatype, mode))
+    metadata = facts.embedded_metadata(original.metadata, mode, meta)
+    if metadata is None:
+        metadata = facts.extract_metadata(fp).dict(exclude_unset=False)
+    else:
+        known = {k: v for k, v in metadata.items() if v is not None}
+        facts.seed(facts.METADATA, fp, iss.IsccMeta.construct(**known))
+    return store_media_obj(media_obj, fp, metadata)
+
+
+def new_media_obj(fp, original=None, data=False):
+    # type: (str, Optional["Media"], bool) -> "Media"
+    """Create a Media object with the hashes of the local file at `fp`."""
     from iscc_generator.models import Media
 
     media_obj = Media.objects.create()
-    filename = basename(fp)
-    media_obj.name = filename
-    media_obj.type, _ = idk.mediatype_and_mode(fp)
-    media_obj.size = getsize(fp)
-    media_obj.metadata = idk.extract_metadata(fp).dict(exclude_unset=False)
-    media_obj.cid = idk.ipfs_cidv1(fp)
+    media_obj.name = basename(fp)
+    digests = hash_file(fp, data=data)
+    facts.register(fp, digests)
+    media_obj.digests = digests
+    media_obj.size = digests.size
+    media_obj.cid = digests.cid
+    media_obj.datahash = digests.datahash
+    media_obj.chunks = digests.chunks
     media_obj.original = original
-    storage_name = f"{media_obj.flake}/{filename}"
-    media_obj.source_file.name = storage_name
-    storage: Storage = default_storage
-    with open(fp, "rb") as infile:
-        storage.save(storage_name, infile)
+    return media_obj
+
+
+def chunk_table(media_obj, fp):
+    # type: ("Media", str) -> bytes
+    """
+    Return the CDC chunk table of a Media object with its file at local path `fp`.
+
+    The table is taken from the object itself or another Media object with identical content.
+    Otherwise it is computed and persisted.
+    """
+    from iscc_generator.models import Media
+
+    if media_obj.chunks is None and media_obj.datahash:
+        stored = Media.objects.filter(datahash=media_obj.datahash, chunks__isnull=False).first()
+        if stored:
+            media_obj.chunks = stored.chunks
+    if media_obj.chunks is None:
+        digests = facts.digests(fp)
+        if digests is None or digests.chunks is None:
+            digests = hash_file(fp, data=True)
+        media_obj.chunks = digests.chunks
+        Media.objects.filter(pk=media_obj.pk).update(chunks=media_obj.chunks)
+    return bytes(media_obj.chunks)
+
+
+def store_media_obj(media_obj, fp, metadata=None):
+    # type: ("Media", str, Optional[dict]) -> "Media"
+    """
+    Upload the local file at `fp` to the storage backend and save `media_obj`.
+
+    If a file with identical content is already stored, it is reused instead of uploaded again.
+
+    :param Media media_obj: Media object created with `new_media_obj`
+    :param str fp: Local filepath of media file
+    :param dict metadata: Known metadata of the file (extracted if not provided)
+    """
+    from iscc_generator.models import Media
+
+    duplicate = Media.find_duplicate(media_obj.cid)
+    if duplicate:
+        media_obj.source_file.name = duplicate.source_file.name
+        media_obj.metadata = duplicate.metadata
+    else:
+        if metadata is None:
+            metadata = facts.extract_metadata(fp).dict(exclude_unset=False)
+        media_obj.metadata = metadata
+        storage_name = f"{media_obj.flake}/{media_obj.name}"
+        media_obj.source_file.name = storage_name
+        storage: Storage = default_storage
+        with open(fp, "rb") as infile:
+            storage.save(storage_name, infile)
     media_obj.save()
     return media_obj
 
@@ -67,3 +165,10 @@ def store_local_temp(fileobj, filename):
             tmpfile.write(data)
             data = fileobj.read(1024 * 1024)
     return tmpfile_path
+
+
+def remove_local_temp(fp):
+    # type: (Optional[str]) -> None
+    """Remove a file from local temp storage together with its temporary directory."""
+    if fp:
+        shutil.rmtree(dirname(fp), ignore_errors=True)
@@ -1,23 +1,28 @@
 # -*- coding: utf-8 -*-
-import json
-from data_url import DataURL
 import os
-import iscc_sdk as idk
-import iscc_core as ic
-from iscc_generator.download import download_media, download_url
-from iscc_generator.models import Nft
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection
+from iscc_generator import facts
+from iscc_generator.download import download_media
+from iscc_generator.hashing import hash_file, wrap_cid
+from iscc_generator.models import Media, Nft
+from iscc_generator.pipeline import run_pipeline
 from iscc_generator.schema import NftSchema
-from iscc_generator.storage import media_obj_from_path
+from iscc_generator.storage import remove_local_temp
 from constance import config
 from iscc_generator.utils import forecast_iscc_id
 
 
+@facts.scoped
 def iscc_generator_task(pk: int):
     """
     Create an ISCC Code for an IsccCode database object.
 
+    Runs all stages of the generator pipeline inline (see `iscc_generator.pipeline`):
+
+    - serves result from cache if the same content was processed with the same metadata before
     - retrieves asset to local temp storage
-    - embeds metadata
+    - embeds metadata (unless the file already carries it)
     - stores new Media object
     - generates ISCC
     - stores result in IsccCode
@@ -26,58 +31,11 @@ def iscc_generator_task(pk: int):
     :return: The result of the ISCC processor
     :rtype: dict
     """
-    from iscc_generator.models import IsccCode
-
-    iscc_obj = IsccCode.objects.get(pk=pk)
-    media_obj = iscc_obj.source_file
-
-    # retrieve file for local processing
-    if media_obj:
-        temp_fp = download_media(media_obj)
-    elif iscc_obj.source_url:
-        temp_fp = download_url(iscc_obj.source_url)
-        media_obj = media_obj_from_path(temp_fp)
-    else:
-        raise ValueError("Need at least source_file or source_url.")
-
-    # embed user provided metadata
-    user_metadata = iscc_obj.get_metadata()
-    embed_fp = None
-    if user_metadata.dict(exclude_unset=True):
-        # ensure IsccMeta.meta is a data url for embedding
-        if iscc_obj.meta and not iscc_obj.meta.startswith("data:"):
-            data = json.loads(iscc_obj.meta)
-            serialized = ic.json_canonical(data)
-            durl_obj = DataURL.from_data("application/json", base64_encode=True, data=serialized)
-            user_metadata.meta = durl_obj.url
-        else:
-            user_metadata.meta = iscc_obj.meta
-
-        embed_fp = idk.embed_metadata(temp_fp, user_metadata)
-        if embed_fp:
-            # remote store and set new media object
-            media_obj = media_obj_from_path(embed_fp, original=media_obj)
-            iscc_obj.source_file = media_obj
-
-    target_fp = embed_fp or temp_fp
-
-    # generate iscc code
-    iscc_result_obj = idk.code_iscc(target_fp)
-    # Set media_id
-    iscc_result_obj.media_id = media_obj.flake
-
-    iscc_obj.iscc = iscc_result_obj.iscc
-    iscc_obj.result = iscc_result_obj.dict(by_alias=True, exclude_none=True, exclude_unset=False)
-    iscc_obj.save()
-
-    # cleanup files
-    os.remove(temp_fp)
-    if embed_fp:
-        os.remove(embed_fp)
-
+    iscc_obj = run_pipeline(pk)
     return dict(result=iscc_obj.iscc)
 
 
+@facts.scoped
 def nft_generator_task(pk: int):
     """
     Create an NftPackage for an IsccCode database object.
@@ -90,9 +48,32 @@ def nft_generator_task(pk: int):
 
     # Choose the Media object
     media_obj = nft_obj.media_id_animation if nft_obj.media_id_animation else nft_obj.media_id_image
+    has_iscc = media_obj.iscc_codes.exists()
 
+    # Compute missing wrapped CIDs in local threads while the ISCC is generated here
+    wrapping = {}
+    pool = None
+    if config.IPFS_WRAP:
+        pending = []
+        for wrap_obj in (nft_obj.media_id_image, nft_obj.media_id_animation):
+            if wrap_obj and not wrap_obj.cid_wrapped and wrap_obj not in pending:
+                pending.append(wrap_obj)
+        if pending:
+            pool = ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="nft-cid")
+            for wrap_obj in pending:
+                wrapping[wrap_obj.pk] = pool.submit(media_cid_wrapped_thread, wrap_obj)
+    try:
+        return nft_package(nft_obj, media_obj, has_iscc, wrapping)
+    finally:
+        if pool:
+            pool.shutdown()
+
+
+def nft_package(nft_obj, media_obj, has_iscc, wrapping):
+    # type: (Nft, Media, bool, dict) -> dict
+    """Generate the ISCC of `media_obj` if needed and store the NftPackage of `nft_obj`."""
     # Get or create IsccCode
-    if media_obj.iscc_codes.exists():
+    if has_iscc:
         iscc_obj = media_obj.iscc_codes.first()
     else:
         # Create ISCC-CODE
@@ -125,16 +106,10 @@ def nft_generator_task(pk: int):
 
     # Set NFT IPFS hashes
     if config.IPFS_WRAP:
-        # we need to download assets and create a wrapped ipfs cid
-        temp_image = download_media(nft_obj.media_id_image)
-        cid_w = idk.ipfs_cidv1(temp_image, wrap=True)
-        iscc_meta["image"] = f"ipfs://{cid_w}"
-        os.remove(temp_image)
+        iscc_meta["image"] = f"ipfs://{join_cid_wrapped(nft_obj.media_id_image, wrapping)}"
         if nft_obj.media_id_animation:
-            temp_animation = download_media(nft_obj.media_id_animation)
-            cid_w = idk.ipfs_cidv1(temp_animation, wrap=True)
+            cid_w = join_cid_wrapped(nft_obj.media_id_animation, wrapping)
             iscc_meta["animation_url"] = f"ipfs://{cid_w}"
-            os.remove(temp_animation)
     else:
         iscc_meta["image"] = f"ipfs://{nft_obj.media_id_image.cid}"
         if nft_obj.media_id_animation:
@@ -150,3 +125,77 @@ def nft_generator_task(pk: int):
     nft_obj.result = np
     nft_obj.save()
     return dict(result=nft_obj.flake)
+
+
+def media_cid_wrapped(media_obj):
+    # type: (Media) -> str
+    """
+    Wrapped IPFS CIDv1 of a Media object.
+
+    The wrapped CID is stored with the Media object when its file is hashed. For objects stored
+    before, the file is retrieved once and the computed CID is persisted.
+
+    :param Media media_obj: The Media object
+    :return: Directory CIDv1 with the filename appended (`<cid>/<filename>`)
+    :rtype: str
+    """
+    if not media_obj.cid_wrapped:
+        temp_fp = download_media(media_obj)
+        try:
+            digests = facts.digests(temp_fp) or hash_file(temp_fp)
+            media_obj.cid_wrapped = wrap_cid(digests.ipfs_root, os.path.basename(temp_fp))
+        finally:
+            remove_local_temp(temp_fp)
+        Media.objects.filter(pk=media_obj.pk).update(cid_wrapped=media_obj.cid_wrapped)
+    return media_obj.cid_wrapped
+
+
+def media_cid_wrapped_thread(media_obj):
+    # type: (Media) -> str
+    """Run `media_cid_wrapped` in a local thread and close the database connection of the thread."""
+    try:
+        return media_cid_wrapped(media_obj)
+    finally:
+        connection.close()
+
+
+def join_cid_wrapped(media_obj, wrapping):
+    # type: (Media, dict) -> str
+    """
+    Wrapped IPFS CIDv1 of a Media object (computed by a local thread if one was started).
+
+    :param Media media_obj: The Media object
+    :param dict wrapping: Futures of `media_cid_wrapped_thread` by Media primary key
+    :return: Directory CIDv1 with the filename appended (`<cid>/<filename>`)
+    :rtype: str
+    """
+    future = wrapping.get(media_obj.pk)
+    if future:
+        media_obj.cid_wrapped = future.result()
+    return media_cid_wrapped(media_obj)
+
+
+@facts.scoped
+def media_metadata_task(pk: int):
+    """
+    Extract embedded metadata for a Media object uploaded with DEFER_MEDIA_METADATA.
+
+    Pending Media objects with identical content receive the same metadata.
+
+    :param int pk: Primary key of the Media entry
+    :return: The primary key of the Media entry
+    :rtype: dict
+    """
+    media_obj = Media.objects.get(pk=pk)
+    if media_obj.metadata is None:
+        temp_fp = download_media(media_obj)
+        try:
+            media_obj.extract_metadata(temp_fp)
+        finally:
+            remove_local_temp(temp_fp)
+        Media.objects.filter(pk=pk).update(metadata=media_obj.metadata)
+        if media_obj.cid:
+            Media.objects.filter(cid=media_obj.cid, metadata__isnull=True).update(
+                metadata=media_obj.metadata
+            )
+    return dict(result=media_obj.flake)
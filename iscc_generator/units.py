@@ -0,0 +1,72 @@
+"""
+ISCC generation reusing the Digests of a single hashing pass over the file.
+
+`code_iscc` and `code_meta` mirror `iscc_sdk.main.code_iscc` and `iscc_sdk.main.code_meta` of
+iscc-sdk 0.4.9 (see tests/test_units.py for the comparison with the installed sdk). Content-Codes
+are generated by the sdk itself.
+"""
+from os.path import basename
+from typing import Optional
+import iscc_core as ic
+import iscc_sdk as idk
+from iscc_generator import facts
+from iscc_generator.hashing import Digests, hash_file
+
+
+def code_iscc(fp, digests=None):
+    # type: (str, Optional[Digests]) -> idk.IsccMeta
+    """
+    Generate ISCC-CODE (same result as `iscc_sdk.code_iscc`).
+
+    Data-Code and Instance-Code are taken from `digests` instead of reading the file again.
+    Metadata is probed via `facts` (memoized within a task).
+
+    :param str fp: Filepath used for ISCC-CODE creation.
+    :param Digests digests: Digests of the file at `fp` computed with Data-Code
+    :return: ISCC metadata including ISCC-CODE and merged metadata from ISCC-UNITs.
+    """
+    if digests is None or digests.data_code is None:
+        digests = hash_file(fp, data=True)
+    facts.register(fp, digests)
+    instance = dict(iscc=digests.instance_code, datahash=digests.datahash, filesize=digests.size)
+    data = dict(iscc=digests.data_code)
+    content = idk.code_content(fp)
+    meta = code_meta(fp)
+
+    # Compose ISCC-CODE
+    iscc_code = ic.gen_iscc_code_v0([meta.iscc, content.iscc, data["iscc"], instance["iscc"]])
+
+    # Merge ISCC Metadata
+    iscc_meta = dict(filename=basename(fp))
+    iscc_meta.update(instance)
+    iscc_meta.update(data)
+    iscc_meta.update(content.dict())
+    iscc_meta.update(meta.dict())
+    iscc_meta.update(iscc_code)
+    return idk.IsccMeta.construct(**iscc_meta)
+
+
+def code_meta(fp):
+    # type: (str) -> idk.IsccMeta
+    """Create ISCC Meta-Code (same result as `iscc_sdk.code_meta` with memoized metadata)."""
+    meta = facts.extract_metadata(fp).dict()
+
+    if not meta.get("name"):
+        meta["name"] = idk.text_name_from_uri(fp)
+
+    metacode = ic.gen_meta_code_v0(
+        name=meta.get("name"),
+        description=meta.get("description"),
+        meta=meta.get("meta"),
+        bits=meta_bits(),
+    )
+
+    meta.update(metacode)
+    return idk.IsccMeta.construct(**meta)
+
+
+def meta_bits():
+    # type: () -> int
+    """Configured Meta-Code length (`core_opts` of iscc-sdk 0.4.9, `sdk_opts` of older releases)."""
+    opts = getattr(idk, "core_opts", None) or idk.sdk_opts
+    return opts.meta_bits
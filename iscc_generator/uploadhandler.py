@@ -1,19 +1,28 @@
 # -*- coding: utf-8 -*-
-from django.core.files.uploadhandler import FileUploadHandler
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.conf import settings
 from ninja.errors import HttpError
 import humanize
+from iscc_generator.hashing import MediaHasher
 
 
-class IsccQuotaUploadHandler(FileUploadHandler):
+class IsccQuotaUploadHandler(TemporaryFileUploadHandler):
     """
     This upload handler terminates the connection if more than FILE_SIZE_LIMIT is uploaded.
+
+    While the upload is streamed to a temporary file the IPFS CIDv1, the blake3 datahash and the
+    size are computed incrementally and attached to the uploaded file as `digests`.
     """
 
     def __init__(self, request=None):
         super().__init__(request)
         self.total_upload = 0
         self.quota = settings.UPLOAD_SIZE_LIMIT * 1000000
+        self.hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = MediaHasher()
 
     def receive_data_chunk(self, raw_data, start):
         self.total_upload += len(raw_data)
@@ -22,7 +31,10 @@ class IsccQuotaUploadHandler(FileUploadHandler):
                 400,
                 message=f"Upload file size limit of {humanize.naturalsize(self.quota)} exeeded!",
             )
-        return raw_data
+        self.hasher.push(raw_data)
+        return super().receive_data_chunk(raw_data, start)
 
     def file_complete(self, file_size):
-        return None
+        file = super().file_complete(file_size)
+        file.digests = self.hasher.digests()
+        return file
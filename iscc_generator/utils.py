@@ -1,7 +1,7 @@
-import requests
 from loguru import logger as log
 from django.conf import settings
 from eth_utils.address import to_checksum_address
+from iscc_generator import forecast
 from iscc_generator.codegen.spec import NftPostRequest
 import iscc_core as ic
 
@@ -22,16 +22,9 @@ def forecast_iscc_id(iscc_code: str, chain_id: str, wallet: str) -> str:
         chain_id=chain_map[chain_id],
         wallet=wallet,
     )
+    iscc_id = ic.gen_iscc_id(**data)["iscc"]
     if settings.ISCC_ID_FORECAST_URL:
-        url = settings.ISCC_ID_FORECAST_URL
-        try:
-            resp = requests.post(url, json=data)
-            iscc_id = resp.json()["iscc_id"]
-        except Exception as e:
-            log.warning("failed iscc-id remote forecasting, fallback to local")
-            log.exception(e)
-            iscc_id = ic.gen_iscc_id(**data)["iscc"]
+        iscc_id = forecast.forecast(data, iscc_id)
     else:
         log.warning("no remote forecast url configured, using local forcasting")
-        iscc_id = ic.gen_iscc_id(**data)["iscc"]
     return iscc_id
@@ -1,7 +1,7 @@
 from pathlib import Path
 from collections import OrderedDict as OrderedDictObject
 from typing import Dict, List, OrderedDict
-from pydantic import BaseSettings, Field
+from pydantic import BaseSettings, Field, root_validator
 from pydantic.fields import Undefined
 from .pydjantic import BaseDBConfig, to_django
 from typing import Optional
@@ -83,7 +83,6 @@ class GeneralSettings(BaseSettings):
     # Upload file pre-processing does not work with InMemoryUploadedFile!!!
     FILE_UPLOAD_HANDLERS: List[str] = [
         "iscc_generator.uploadhandler.IsccQuotaUploadHandler",
-        "django.core.files.uploadhandler.TemporaryFileUploadHandler",
     ]
 
     DEFAULT_FILE_STORAGE: str = "django.core.files.storage.FileSystemStorage"
@@ -149,17 +148,25 @@ class ConstanceSettings(BaseSettings):
             ("DOMAIN", ("https://example.com", "Domain where this service is hosted", "url_field")),
             ("IPFS_WRAP", (False, "Wrap file with dicectory for IPFS URIs")),
             ("NFT_EXCLUDE_FIELDS", ("", "Comma separated list of fields to exclude from results")),
+            ("MEDIA_DEDUP", (True, "Reuse stored files and metadata for identical media uploads")),
+            ("DEFER_MEDIA_METADATA", (False, "Extract metadata of uploads in a worker task")),
             ("DOWNLOAD_TIMEOUT", (5, "Timeout in seconds for media downloads")),
             ("DOWNLOAD_VERIFY_TLS", (True, "Verify TLS for media downloads")),
             ("DOWNLOAD_SIZE_LIMIT", (100, "Maximum size for media file downloads in MB")),
             ("PROCESSING_TIMEOUT", (10, "Seconds to wait before returning an async task")),
+            ("BATCH_SIZE_LIMIT", (1000, "Maximum number of items per batch request")),
+            ("RESULT_CACHE", (True, "Reuse ISCC results for identical content and metadata")),
+            ("RESULT_CACHE_TTL", (0, "Days until cached ISCC results expire (0 = never)")),
+            ("RESULT_CACHE_MAX_ENTRIES", (100000, "Maximum number of cached ISCC results")),
         ]
     )
     CONSTANCE_CONFIG_FIELDSETS: OrderedDict = OrderedDictObject([
         ("General", ("DOMAIN",)),
-        ("API Settings", ("IPFS_WRAP", "NFT_EXCLUDE_FIELDS",)),
+        ("API Settings", ("IPFS_WRAP", "NFT_EXCLUDE_FIELDS", "MEDIA_DEDUP",
+                          "DEFER_MEDIA_METADATA",)),
         ("Asset Downloads", ("DOWNLOAD_TIMEOUT", "DOWNLOAD_VERIFY_TLS", "DOWNLOAD_SIZE_LIMIT")),
-        ("Tasks Processing", ("PROCESSING_TIMEOUT",)),
+        ("Tasks Processing", ("PROCESSING_TIMEOUT", "BATCH_SIZE_LIMIT")),
+        ("Result Cache", ("RESULT_CACHE", "RESULT_CACHE_TTL", "RESULT_CACHE_MAX_ENTRIES")),
     ])
     CONSTANCE_ADDITIONAL_FIELDS: Dict = {
         "url_field": ["django.forms.fields.CharField"],
@@ -170,6 +177,91 @@ class ConstanceSettings(BaseSettings):
 class IsccGeneratorSettings(BaseSettings):
     UPLOAD_SIZE_LIMIT: int = 100
     ISCC_ID_FORECAST_URL: Optional[str] = Field(None, description="API URL for ISCC-ID forecasts")
+    ISCC_ID_FORECAST_BUDGET: float = Field(
+        1.0, description="Seconds to wait for a remote ISCC-ID forecast before using a local one"
+    )
+    ISCC_ID_FORECAST_TIMEOUT: float = Field(
+        10.0, description="Timeout in seconds of remote ISCC-ID forecast requests"
+    )
+    ISCC_ID_FORECAST_CACHE_TTL: int = Field(
+        3600, description="Seconds to cache remote ISCC-ID forecasts"
+    )
+    ISCC_ID_FORECAST_BREAKER_THRESHOLD: int = Field(
+        5, description="Consecutive failed or slow forecasts that suspend remote forecasting"
+    )
+    ISCC_ID_FORECAST_BREAKER_COOLDOWN: float = Field(
+        30.0, description="Seconds until suspended remote forecasting is tried again"
+    )
+    ISCC_ID_FORECAST_WORKERS: int = Field(
+        4, description="Maximum number of concurrent remote ISCC-ID forecasts per process"
+    )
+    INSTANCE_MT_THRESHOLD: int = Field(
+        64, description="Minimum filesize in MB for multithreaded blake3 Instance-Code hashing"
+    )
+    TASK_POLL_INTERVAL: float = Field(
+        0.25, description="Seconds between task result checks if Postgres LISTEN is unavailable"
+    )
+    TASK_LISTEN_RETRY: float = Field(
+        30.0, description="Seconds until a failed Postgres LISTEN connection is tried again"
+    )
+    ASYNC_DB_THREAD_SENSITIVE: bool = Field(
+        True, description="Serialize database access from async views on a single thread"
+    )
+    ASYNC_DB_WORKERS: int = Field(
+        8, description="Size of the database thread pool if ASYNC_DB_THREAD_SENSITIVE is off"
+    )
+    DOWNLOAD_HTTP2: bool = Field(True, description="Use HTTP/2 for downloads if supported")
+    DOWNLOAD_MAX_CONNECTIONS: int = Field(
+        20, description="Maximum number of pooled download connections per process"
+    )
+    DOWNLOAD_MAX_CONNECTIONS_PER_HOST: int = Field(
+        4, description="Maximum number of concurrent downloads per host and process"
+    )
+    DOWNLOAD_KEEPALIVE_EXPIRY: float = Field(
+        30.0, description="Seconds to keep idle download connections open"
+    )
+    DOWNLOAD_CACHE_DIR: Optional[str] = Field(
+        None, description="Directory of the download cache (defaults to the temp directory)"
+    )
+    DOWNLOAD_CACHE_SIZE: int = Field(
+        1000, description="Maximum size of the download cache in MB (0 = disabled)"
+    )
+    DOWNLOAD_SEGMENTS: int = Field(
+        4, description="Concurrent range requests per download (1 = single stream only)"
+    )
+    DOWNLOAD_SEGMENT_SIZE: int = Field(16, description="Size of range request segments in MB")
+    DOWNLOAD_SEGMENT_RETRIES: int = Field(3, description="Retries per failed download segment")
+    MEDIA_CACHE_DIR: Optional[str] = Field(
+        None, description="Directory of the remote media cache (defaults to the temp directory)"
+    )
+    MEDIA_CACHE_SIZE: int = Field(
+        2000, description="Maximum size of the remote media cache in MB (0 = disabled)"
+    )
+    PIPELINE_IO_CLUSTER: Optional[str] = Field(
+        None, description="Name of the task queue for I/O bound pipeline stages"
+    )
+    PIPELINE_CPU_CLUSTER: Optional[str] = Field(
+        None, description="Name of the task queue for CPU bound pipeline stages"
+    )
+    INLINE_MAX_SIZE: int = Field(
+        0,
+        description=(
+            "Uploads up to this size (bytes) are processed within the API request in a "
+            "local process pool instead of the task queue (0 disables inline processing)"
+        ),
+    )
+    INLINE_WORKERS: int = Field(
+        2, description="Size of the process pool and maximum of concurrent inline requests"
+    )
+    QUEUE_LANES: Dict[str, Dict] = Field(
+        {},
+        description=(
+            "Processing lanes as named task queues. A lane may limit `max_size` (bytes) "
+            "and `modes` (ISCC modes) of the media it accepts and set `workers` and `timeout` "
+            "(seconds, below the Q_CLUSTER `retry`). Tasks go to the first matching lane, "
+            "otherwise to the default queue."
+        ),
+    )
 
 
 class S3Settings(BaseSettings):
@@ -190,10 +282,17 @@ class ProjectSettings(
     IsccGeneratorSettings,
     S3Settings,
 ):
-    pass
-
     class Config:
         env_file = ".env"
 
+    @root_validator(skip_on_failure=True)
+    def lane_timeouts_below_retry(cls, values):
+        # the broker hands out unacknowledged tasks again after `retry` seconds (default 60)
+        retry = values["Q_CLUSTER"].get("retry", 60)
+        for lane, config in values["QUEUE_LANES"].items():
+            if config.get("timeout", 0) >= retry:
+                raise ValueError(f"Timeout of lane {lane} must be below Q_CLUSTER retry ({retry})")
+        return values
+
 
 to_django(ProjectSettings())
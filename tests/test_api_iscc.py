@@ -7,3 +7,16 @@ def test_iscc_code_post_empty(live_server):
     response = requests.post(url)
     assert response.status_code == 400
     assert response.json() == {"detail": "Either source_file or source_url is required"}
+
+
+def test_iscc_code_batch_post_empty(live_server):
+    url = live_server.url + "/api/iscc_code/batch"
+    response = requests.post(url)
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Either source_files or source_urls are required"}
+
+
+def test_iscc_code_batch_get_missing(live_server):
+    url = live_server.url + "/api/iscc_code/batch/05VN6J5C067J4"
+    response = requests.get(url)
+    assert response.status_code == 404
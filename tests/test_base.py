@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import threading
+from asgiref.sync import async_to_sync
+from iscc_generator.base import db_sync_to_async
+
+
+@db_sync_to_async
+def current_thread_name():
+    return threading.current_thread().name
+
+
+def test_db_sync_to_async_thread_pool(settings):
+    settings.ASYNC_DB_THREAD_SENSITIVE = False
+    assert async_to_sync(current_thread_name)().startswith("db")
+
+
+def test_db_sync_to_async_thread_sensitive(settings):
+    settings.ASYNC_DB_THREAD_SENSITIVE = True
+    assert not async_to_sync(current_thread_name)().startswith("db")
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+import os
+from iscc_generator.diskcache import DiskCache
+
+
+def test_diskcache_lru_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), max_size=10)
+    src = tmp_path / "src"
+    src.write_bytes(b"12345")
+    assert cache.put("a", str(src), {"n": 1}).endswith("data")
+    cache.put("b", str(src))
+    os.utime(cache.entry_dir("a"), (0, 0))
+    os.utime(cache.entry_dir("b"), (1, 1))
+    assert cache.get("a") is not None  # touches "a"
+    cache.put("c", str(src))
+    assert cache.get("b") is None
+    assert cache.get("a")[1] == {"n": 1}
+    assert cache.get("c") is not None
+    src.write_bytes(b"12345678901")
+    assert cache.put("d", str(src)) is None
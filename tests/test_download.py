@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from ninja.errors import HttpError
+from iscc_generator import client, download
+
+
+def test_download_url(live_server):
+    fp = download.download_url(live_server.url + "/api/openapi.json")
+    assert os.path.basename(fp) == "openapi.json"
+    assert os.path.getsize(fp) > 0
+
+
+def test_async_download_url(live_server):
+    fp = async_to_sync(download.async_download_url)(live_server.url + "/api/openapi.json")
+    assert os.path.basename(fp) == "openapi.json"
+    assert os.path.getsize(fp) > 0
+
+
+def test_download_url_size_limit(live_server):
+    from constance import config
+
+    limit = config.DOWNLOAD_SIZE_LIMIT
+    config.DOWNLOAD_SIZE_LIMIT = 0
+    try:
+        with pytest.raises(HttpError):
+            download.download_url(live_server.url + "/api/openapi.json")
+    finally:
+        config.DOWNLOAD_SIZE_LIMIT = limit
+
+
+def test_async_clients_of_closed_loops_dropped():
+    async def get_client():
+        client.async_host_semaphore("http://example.com/file.txt")
+        return client.get_async_client()
+
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+    assert first is not second
+    assert len(client._async_clients) == 1
+    assert len(client._async_host_locks) == 1
+
+
+def test_download_url_cache(live_server, settings, tmp_path):
+    from iscc_generator.models import CacheStats
+
+    settings.DOWNLOAD_CACHE_DIR = str(tmp_path)
+    download._download_cache = None
+    url = live_server.url + "/static/iscc_generator/iscc-logo-icon-black.svg"
+    first = download.download_url(url)
+    second = download.download_url(url)
+    assert first != second
+    assert open(first, "rb").read() == open(second, "rb").read()
+    stats = CacheStats.objects.get(name="download")
+    assert (stats.hits, stats.misses) == (1, 1)
+    download._download_cache = None
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        FlakyHandler.requests += 1
+        if FlakyHandler.requests > 1:
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("etag", '"v1"')
+        self.send_header("content-length", "11")
+        self.end_headers()
+        self.wfile.write(b"hello world")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_download_url_cache_failed_revalidation(db, settings, monkeypatch, tmp_path):
+    settings.DOWNLOAD_CACHE_DIR = str(tmp_path / "cache")
+    monkeypatch.setattr(download, "_download_cache", None)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/hello.txt"
+    try:
+        download.remove_local_temp(download.download_url(url))
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path / "temp"))
+        os.mkdir(tmp_path / "temp")
+        with pytest.raises(httpx.HTTPStatusError):
+            download.download_url(url)
+    finally:
+        server.shutdown()
+    # the linked copy of the cached file was removed
+    assert os.listdir(tmp_path / "temp") == []
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    data = os.urandom(2500000)
+    ranges = []
+
+    def do_GET(self):
+        first, last = 0, len(self.data) - 1
+        if "range" in self.headers:
+            first, last = map(int, self.headers["range"].split("=")[1].split("-"))
+            self.ranges.append((first, last))
+            self.send_response(206)
+            self.send_header("content-range", f"bytes {first}-{last}/{len(self.data)}")
+        else:
+            self.send_response(200)
+        self.send_header("accept-ranges", "bytes")
+        self.send_header("content-length", str(last - first + 1))
+        self.end_headers()
+        self.wfile.write(self.data[first : last + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+def test_download_url_segments(db, settings):
+    settings.DOWNLOAD_SEGMENT_SIZE = 1
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        fp = download.download_url(f"http://127.0.0.1:{server.server_port}/video.mp4")
+    finally:
+        server.shutdown()
+    assert open(fp, "rb").read() == RangeHandler.data
+    assert sorted(RangeHandler.ranges) == [(0, 999999), (1000000, 1999999), (2000000, 2499999)]
+
+
+class UnsizedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # no content-length, the size limit applies while streaming
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"0" * 2500000)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_download_url_size_limit_removes_partial_file(db, monkeypatch, tmp_path):
+    from constance import config
+
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UnsizedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    limit = config.DOWNLOAD_SIZE_LIMIT
+    config.DOWNLOAD_SIZE_LIMIT = 1
+    try:
+        with pytest.raises(HttpError):
+            download.download_url(f"http://127.0.0.1:{server.server_port}/file.bin")
+    finally:
+        config.DOWNLOAD_SIZE_LIMIT = limit
+        server.shutdown()
+    assert os.listdir(tmp_path) == []
+
+
+class BusyRangeHandler(RangeHandler):
+    lock = threading.Lock()
+    active = 0
+    peak = 0
+    busy = set()
+    changed = False
+
+    def do_GET(self):
+        cls = BusyRangeHandler
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            rng = self.headers.get("range")
+            if rng and cls.changed:
+                # a new version of the file, if-range does not match
+                self.send_response(200)
+                self.send_header("content-length", "0")
+                self.end_headers()
+            elif rng and rng not in cls.busy:
+                cls.busy.add(rng)
+                self.send_response(503)
+                self.send_header("retry-after", "0")
+                self.send_header("content-length", "0")
+                self.end_headers()
+            else:
+                super().do_GET()
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def end_headers(self):
+        self.send_header("etag", '"v1"')
+        super().end_headers()
+
+
+@pytest.fixture
+def busy_server(settings, monkeypatch):
+    settings.DOWNLOAD_SEGMENT_SIZE = 1
+    settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST = 1
+    monkeypatch.setattr(client, "_host_locks", {})
+    BusyRangeHandler.busy, BusyRangeHandler.peak = set(), 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BusyRangeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/video.mp4"
+    server.shutdown()
+
+
+def test_download_url_segments_retry_and_host_limit(db, busy_server):
+    BusyRangeHandler.changed = False
+    fp = download.download_url(busy_server)
+    assert open(fp, "rb").read() == RangeHandler.data
+    assert len(BusyRangeHandler.busy) == 3
+    assert BusyRangeHandler.peak == 1
+
+
+def test_download_url_segments_source_changed(db, busy_server, monkeypatch):
+    monkeypatch.setattr(BusyRangeHandler, "changed", True)
+    with pytest.raises(HttpError) as excinfo:
+        download.download_url(busy_server)
+    assert excinfo.value.status_code == 409
+
+
+def test_download_media_local_storage(db):
+    from django.core.files.base import ContentFile
+    from iscc_generator.models import Media
+
+    media_obj = Media(name="hello.txt")
+    media_obj.source_file.save("hello.txt", ContentFile(b"hello world"))
+    fp = download.download_media(media_obj)
+    assert os.path.basename(fp) == "hello.txt"
+    assert os.path.samefile(fp, media_obj.source_file.path)
+    download.remove_local_temp(fp)
+    assert not os.path.exists(os.path.dirname(fp))
+    assert os.path.exists(media_obj.source_file.path)
+    media_obj.source_file.delete()
+
+
+def test_download_media_remote_cache(db, settings, tmp_path, monkeypatch):
+    from django.core.files.base import ContentFile
+    from iscc_generator.models import CacheStats, Media
+
+    settings.MEDIA_CACHE_DIR = str(tmp_path)
+    monkeypatch.setattr(download, "_media_cache", None)
+    monkeypatch.setattr(download, "local_storage_path", lambda media_obj: None)
+    media_obj = Media(
+        name="hello.txt", cid="bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+    )
+    media_obj.source_file.save("hello.txt", ContentFile(b"hello world"))
+    first = download.download_media(media_obj)
+    second = download.download_media(media_obj)
+    assert os.path.samefile(first, second)
+    assert open(second, "rb").read() == b"hello world"
+    stats = CacheStats.objects.get(name="media")
+    assert (stats.hits, stats.misses) == (1, 1)
+    media_obj.source_file.delete()
+
+
+def test_async_download_url_off_event_loop(live_server, monkeypatch):
+    threads = []
+
+    def recorded(func):
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    for name in ("cache_lookup", "local_temp_path", "cache_discard", "cache_store"):
+        monkeypatch.setattr(download, name, recorded(getattr(download, name)))
+
+    async def fetch():
+        fp = await download.async_download_url(live_server.url + "/api/openapi.json")
+        return fp, threading.current_thread()
+
+    fp, loop_thread = async_to_sync(fetch)()
+    assert os.path.getsize(fp) > 0
+    assert len(threads) == 4 and loop_thread not in threads
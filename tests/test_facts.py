@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+from iscc_generator import facts, hashing
+
+
+def test_facts_memoized(tmp_path):
+    calls = []
+
+    def probe(fp):
+        calls.append(fp)
+        return len(calls)
+
+    fp = tmp_path / "hello.txt"
+    fp.write_bytes(b"hello world")
+    link = tmp_path / "link.txt"
+    os.link(fp, link)
+    assert facts.memoized("probe", fp.as_posix(), probe) == 1
+    with facts.scope():
+        assert facts.memoized("probe", fp.as_posix(), probe) == 2
+        assert facts.memoized("probe", link.as_posix(), probe) == 2
+        with facts.scope():
+            assert facts.memoized("probe", fp.as_posix(), probe) == 2
+    assert facts.memoized("probe", fp.as_posix(), probe) == 3
+
+
+def test_facts_registered_digests(tmp_path):
+    fp = tmp_path / "hello.txt"
+    fp.write_bytes(b"hello world")
+    digests = hashing.hash_file(fp.as_posix())
+    with facts.scope():
+        facts.register(fp.as_posix(), digests)
+        assert facts.datahash(fp.as_posix()) == digests.datahash
+        assert facts.ipfs_cidv1(fp.as_posix()) == digests.cid
+        assert facts.mediatype_and_mode(fp.as_posix()) == ("text/plain", "text")
+    assert facts.datahash(fp.as_posix()) is None
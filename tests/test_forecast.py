@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from django.core.cache import cache
+from iscc_generator import forecast
+from iscc_generator.models import CacheStats
+
+
+DATA = dict(
+    iscc_code="KACT4EBWK27737D2AYCJRAL5Z36G76RFRMO4554RU26HZ4ORJGIVHDI", chain_id=1, wallet="1Bq"
+)
+
+
+class ForecastHandler(BaseHTTPRequestHandler):
+    requests = []
+    delay = 0.0
+    status = 200
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["content-length"]))
+        self.requests.append(json.loads(body))
+        time.sleep(self.delay)
+        self.send_response(self.status)
+        self.send_header("content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps({"iscc_id": "ISCC:REMOTE"}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def forecast_server(settings, monkeypatch):
+    ForecastHandler.requests = []
+    ForecastHandler.delay = 0.0
+    ForecastHandler.status = 200
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ForecastHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings.ISCC_ID_FORECAST_URL = f"http://127.0.0.1:{server.server_port}/forecast"
+    monkeypatch.setattr(forecast, "breaker", forecast.CircuitBreaker("test", 2, 60))
+    cache.clear()
+    yield ForecastHandler
+    server.shutdown()
+    cache.clear()
+
+
+def test_forecast_remote_cached(db, forecast_server):
+    assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:REMOTE"
+    assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:REMOTE"
+    assert len(forecast_server.requests) == 1
+    stats = CacheStats.objects.get(name="forecast")
+    assert (stats.hits, stats.misses) == (1, 1)
+
+
+def test_forecast_latency_budget(db, forecast_server, settings):
+    settings.ISCC_ID_FORECAST_BUDGET = 0.05
+    forecast_server.delay = 0.3
+    assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:LOCAL"
+    stats = CacheStats.objects.get(name="forecast-remote")
+    assert (stats.hits, stats.misses) == (0, 1)
+    # the late remote answer is cached for later requests
+    time.sleep(0.5)
+    assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:REMOTE"
+
+
+def test_forecast_circuit_breaker(db, forecast_server):
+    forecast_server.status = 500
+    for _ in range(3):
+        assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:LOCAL"
+    assert forecast.breaker.state == forecast.CircuitBreaker.OPEN
+    assert len(forecast_server.requests) == 2
+    forecast.breaker.cooldown = 0
+    forecast_server.status = 200
+    assert forecast.forecast(DATA, "ISCC:LOCAL") == "ISCC:REMOTE"
+    assert forecast.breaker.state == forecast.CircuitBreaker.CLOSED
+
+
+def test_forecast_executor_size(settings, monkeypatch):
+    monkeypatch.setattr(forecast, "_executor", None)
+    settings.ISCC_ID_FORECAST_WORKERS = 2
+    executor = forecast.get_executor()
+    try:
+        assert executor._max_workers == 2
+    finally:
+        executor.shutdown(wait=False)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from iscc_generator import hashing
+
+
+def test_ipfs_hasher_empty():
+    hasher = hashing.IpfsHasher()
+    assert hasher.cid() == "bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku"
+
+
+def test_ipfs_hasher_single_block():
+    hasher = hashing.IpfsHasher()
+    hasher.push(b"hello ")
+    hasher.push(b"world")
+    assert hasher.cid() == "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+
+
+def test_ipfs_hasher_chunking_independent():
+    data = b"\x00\x01\x02\x03" * (hashing.IPFS_CHUNK_SIZE // 2 + 7)
+    a = hashing.IpfsHasher()
+    a.push(data)
+    b = hashing.IpfsHasher()
+    for i in range(0, len(data), 1000):
+        b.push(data[i : i + 1000])
+    assert a.cid() == b.cid()
+    assert a.cid().startswith("bafybei")
+
+
+def test_hash_file(tmp_path):
+    fp = tmp_path / "hello.txt"
+    fp.write_bytes(b"hello world")
+    digests = hashing.hash_file(fp.as_posix())
+    assert digests.ipfs_root.filesize == 11
+    assert digests._replace(ipfs_root=None) == hashing.Digests(
+        cid="bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e",
+        datahash="1e20d74981efa70a0c880b8d8c1985d075dbcbf679b99a5f9914e5aaf96b831a9e24",
+        size=11,
+        instance_code="ISCC:IAA5OSMB56TQUDEI",
+    )
+
+
+def test_wrap_cid(tmp_path):
+    fp = tmp_path / "hello.txt"
+    fp.write_bytes(b"hello world")
+    root = hashing.hash_file(fp.as_posix()).ipfs_root
+    cid = hashing.wrap_cid(root, "hello.txt")
+    # ipfs add --cid-version=1 --wrap-with-directory hello.txt
+    assert cid == "bafybeic6svhkwl3y2wvkj33weshyjjs5cbvgijh7yo3kjasyglrdwe2l74/hello.txt"
+    assert hashing.wrap_cid(root, "other.txt").split("/")[0] != cid.split("/")[0]
+
+
+def test_wrap_cid_multi_chunk(tmp_path):
+    fp = tmp_path / "data.bin"
+    fp.write_bytes(bytes(range(256)) * 1200)
+    digests = hashing.hash_file(fp.as_posix())
+    assert digests.cid == "bafybeiea6hieaul4qfpegxnig3gctj7dlphujrltoxyyg53vjvn6c7widy"
+    assert (
+        hashing.wrap_cid(digests.ipfs_root, "data.bin")
+        == "bafybeihr2dd5kjsrydh2ny3j4cxeh26ft5gxqvxikoqumbz6ztiilx35ku/data.bin"
+    )
+
+
+def test_hash_file_iscc_units(tmp_path):
+    import io
+    import os
+    import iscc_core as ic
+
+    data = os.urandom(3000000)
+    fp = tmp_path / "random.bin"
+    fp.write_bytes(data)
+    digests = hashing.hash_file(fp.as_posix(), data=True, chunk_size=100000)
+    instance = ic.gen_instance_code_v0(io.BytesIO(data))
+    assert digests.instance_code == instance["iscc"]
+    assert digests.datahash == instance["datahash"]
+    assert digests.data_code == ic.gen_data_code_v0(io.BytesIO(data))["iscc"]
+
+
+def test_restore_digests(tmp_path):
+    import os
+
+    fp = tmp_path / "random.bin"
+    fp.write_bytes(os.urandom(300000))
+    digests = hashing.hash_file(fp.as_posix(), data=True)
+    restored = hashing.restore_digests(digests.cid, digests.datahash, digests.size, digests.chunks)
+    assert restored == digests._replace(ipfs_root=None)
+
+
+def test_hash_file_multithreaded_instance(tmp_path):
+    import os
+
+    fp = tmp_path / "random.bin"
+    fp.write_bytes(os.urandom(3000000))
+    streamed = hashing.hash_file(fp.as_posix(), mt_threshold=10000000)
+    threaded = hashing.hash_file(fp.as_posix(), mt_threshold=1)
+    assert streamed == threaded
+
+
+def test_derive_data_code(tmp_path):
+    import random
+
+    rnd = random.Random(0)
+
+    def randbytes(n):
+        # random.Random.randbytes of Python 3.9+
+        return rnd.getrandbits(n * 8).to_bytes(n, "little")
+
+    data = randbytes(200000)
+    src = tmp_path / "source.bin"
+    src.write_bytes(data)
+    src_digests = hashing.hash_file(src.as_posix(), data=True)
+    assert hashing.unpack_chunks(src_digests.chunks)[0][0] > 0
+    derivatives = [
+        data,
+        randbytes(150) + data[100:],
+        data[:5000] + randbytes(3000) + data[5000:],
+        data[:-700] + randbytes(900),
+        randbytes(80) + data[:90000] + data[91000:] + randbytes(100),
+        data[:100],
+    ]
+    for i, derived in enumerate(derivatives):
+        dst = tmp_path / f"derived{i}.bin"
+        dst.write_bytes(derived)
+        full = hashing.hash_file(dst.as_posix(), data=True)
+        code, chunks = hashing.derive_data_code(src.as_posix(), src_digests.chunks, dst.as_posix())
+        assert (code, chunks) == (full.data_code, full.chunks)
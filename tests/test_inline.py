@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import iscc_samples as samples
+import pytest
+from asgiref.sync import sync_to_async
+from iscc_sdk.tools import exiv2_is_installed
+from iscc_generator import inline, models, pipeline
+from iscc_generator.pipeline import Stage, StagePolicy
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    calls = []
+
+    def stage_func(stage, next_stage):
+        def func(iscc_obj):
+            calls.append(stage)
+            if iscc_obj.name == "fail":
+                raise OSError("transient")
+            return next_stage
+
+        return func
+
+    async def run_iscc(iscc_obj):
+        calls.append(Stage.ISCC)
+        return await sync_to_async(pipeline.checkpoint)(iscc_obj, Stage.DONE)
+
+    monkeypatch.setitem(
+        pipeline.STAGES,
+        Stage.FETCH,
+        StagePolicy(stage_func(Stage.FETCH, Stage.EMBED), pipeline.IO, 60, 0, ()),
+    )
+    monkeypatch.setitem(
+        pipeline.STAGES,
+        Stage.EMBED,
+        StagePolicy(stage_func(Stage.EMBED, Stage.ISCC), pipeline.CPU, 60, 0, ()),
+    )
+    monkeypatch.setattr(inline, "run_iscc", run_iscc)
+    return calls
+
+
+def test_inline_accepts(settings):
+    settings.INLINE_MAX_SIZE = 1024
+    assert inline.accepts(models.Media(size=1024))
+    assert not inline.accepts(models.Media(size=1025))
+    assert not inline.accepts(models.Media())
+    assert not inline.accepts(None)
+    settings.INLINE_MAX_SIZE = 0
+    assert not inline.accepts(models.Media(size=1))
+
+
+async def test_inline_generate(transactional_db, settings, stages):
+    settings.INLINE_MAX_SIZE = 1024
+    media_obj = await sync_to_async(models.Media.objects.create)(size=10)
+    iscc_obj = await sync_to_async(models.IsccCode.objects.create)(source_file=media_obj)
+    assert await inline.generate(iscc_obj, media_obj)
+    assert stages == [Stage.FETCH, Stage.EMBED, Stage.ISCC]
+    await sync_to_async(iscc_obj.refresh_from_db)()
+    assert iscc_obj.stage == Stage.DONE
+
+
+async def test_inline_generate_fallback(transactional_db, settings, stages):
+    settings.INLINE_MAX_SIZE = 1024
+    media_obj = await sync_to_async(models.Media.objects.create)(size=10)
+    iscc_obj = await sync_to_async(models.IsccCode.objects.create)(
+        source_file=media_obj, name="fail"
+    )
+    # failed runs continue on the task queue
+    assert not await inline.generate(iscc_obj, media_obj)
+    assert stages == [Stage.FETCH]
+    # all slots busy
+    slots = inline.get_slots()
+    for _ in range(settings.INLINE_WORKERS):
+        slots.acquire()
+    try:
+        assert not await inline.generate(iscc_obj, media_obj)
+    finally:
+        for _ in range(settings.INLINE_WORKERS):
+            slots.release()
+    assert stages == [Stage.FETCH]
+
+
+async def test_inline_broken_pool_restarted(monkeypatch):
+    broken = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    with pytest.raises(Exception):
+        broken.submit(os._exit, 1).result()
+    monkeypatch.setattr(inline, "_pool", broken)
+    assert await inline.run_in_pool(abs, -3) == 3
+    assert inline._pool is not broken
+    inline._pool.shutdown()
+
+
+@pytest.mark.skipif(not exiv2_is_installed(), reason="exiv2 not installed")
+async def test_inline_result_matches_task_queue(transactional_db, settings, tmp_path):
+    from iscc_generator.storage import media_obj_from_path
+
+    settings.INLINE_MAX_SIZE = 10 * 1024 * 1024
+    fp = shutil.copy(samples.images("jpg")[0], tmp_path)
+
+    def create():
+        media_obj = media_obj_from_path(fp, data=True)
+        return [
+            models.IsccCode.objects.create(source_file=media_obj, name="Inline") for _ in range(2)
+        ]
+
+    def run_queued(iscc_obj):
+        # compute again instead of serving the inline result from the result cache
+        models.ResultCache.objects.all().delete()
+        return pipeline.run_pipeline(iscc_obj.pk)
+
+    inline_obj, queued_obj = await sync_to_async(create)()
+    await inline.run_pipeline(inline_obj)
+    queued_obj = await sync_to_async(run_queued)(queued_obj)
+    await sync_to_async(inline_obj.refresh_from_db)()
+    inline_result, queued_result = dict(inline_obj.result), dict(queued_obj.result)
+    # each run stores its own embedded file
+    inline_result.pop("media_id"), queued_result.pop("media_id")
+    assert inline_result == queued_result
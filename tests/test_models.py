@@ -1,3 +1,8 @@
+import shutil
+import iscc_samples as samples
+import iscc_sdk as idk
+import pytest
+from iscc_sdk.tools import exiv2_is_installed, ffmpeg_bin, is_installed
 from iscc_generator import models
 
 
@@ -8,3 +13,196 @@ def test_Iscc_code_get_metadata():
     assert obj.get_metadata() == {}
     obj = models.IsccCode(name="Some asset name")
     assert obj.get_metadata() == {"name": "Some asset name"}
+
+
+def test_media_find_duplicate(db):
+    cid = "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+    assert models.Media.find_duplicate(cid) is None
+    models.Media.objects.create(cid=cid)
+    assert models.Media.find_duplicate(cid) is None
+    first = models.Media.objects.create(cid=cid, source_file="05VN6J5C067J4/hello.txt")
+    models.Media.objects.create(cid=cid, source_file="05VN6J5C067J6/hello.txt")
+    assert models.Media.find_duplicate(cid) == first
+
+
+def test_media_filename_deduplicated(db):
+    media_obj = models.Media.objects.create(name="my file.txt", source_file="05VN6J5C067J4/a.txt")
+    assert media_obj.filename == "my_file.txt"
+    media_obj.source_file.name = f"{media_obj.flake}/my file.txt"
+    assert media_obj.filename == "my file.txt"
+
+
+def test_result_cache(db):
+    from iscc_generator import cache
+
+    media_obj = models.Media.objects.create(datahash="1e20abcd", source_file="05VN6J5C067J4/a.txt")
+    meta = models.IsccCode(name="Some asset name").get_metadata()
+    metahash = cache.metadata_hash(meta)
+    assert cache.result_cache_get(media_obj.datahash, metahash) is None
+    cache.result_cache_set(media_obj.datahash, metahash, {"iscc": "ISCC:AAA"}, media_obj)
+    entry = cache.result_cache_get(media_obj.datahash, metahash)
+    assert entry.result == {"iscc": "ISCC:AAA"}
+    stats = models.CacheStats.objects.get(name=cache.RESULT_CACHE)
+    assert (stats.hits, stats.misses, stats.ratio) == (1, 1, 0.5)
+
+
+def test_media_deferred_metadata(db):
+    from constance import config
+    from django.core.files.uploadedfile import TemporaryUploadedFile
+
+    defer = config.DEFER_MEDIA_METADATA
+    config.DEFER_MEDIA_METADATA = True
+    try:
+        upload = TemporaryUploadedFile("hello.txt", "text/plain", 11, "utf-8")
+        upload.write(b"hello world")
+        upload.seek(0)
+        media_obj = models.Media.objects.create(source_file=upload)
+    finally:
+        config.DEFER_MEDIA_METADATA = defer
+    assert media_obj.cid == "bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e"
+    assert media_obj.metadata is None
+
+
+def known(metadata):
+    """Metadata fields with values (without the JSON-LD defaults)."""
+    return {k: v for k, v in metadata.items() if v is not None and k[0] not in "$@"}
+
+
+def derived_from(tmp_path, mode, metadata, meta):
+    from iscc_generator import facts
+    from iscc_generator.storage import derived_media_obj_from_path
+
+    source = tmp_path / "hello.txt"
+    source.write_bytes(b"hello world")
+    derived = tmp_path / "derived" / "hello.txt"
+    derived.parent.mkdir()
+    derived.write_bytes(b"hello world with metadata")
+    original = models.Media.objects.create(metadata=metadata)
+    with facts.scope():
+        facts.seed(facts.MEDIATYPE, source.as_posix(), (f"{mode}/x-test", mode))
+        media_obj = derived_media_obj_from_path(
+            derived.as_posix(), original, source.as_posix(), meta
+        )
+        extracted = facts.extract_metadata(derived.as_posix()).dict()
+    media_obj.source_file.delete()
+    assert known(extracted) == known(media_obj.metadata)
+    assert media_obj.original == original
+    assert media_obj.type == f"{mode}/x-test"
+    return known(media_obj.metadata)
+
+
+def test_derived_media_obj_from_path(db, tmp_path):
+    import iscc_schema as iss
+
+    metadata = {"name": "Hello", "creator": "Me", "width": 10, "height": 10}
+    meta = iss.IsccMeta(name="New Name", description="Some description")
+    assert derived_from(tmp_path, "image", metadata, meta) == {
+        "name": "New Name",
+        "description": "Some description",
+        "creator": "Me",
+        "width": 10,
+        "height": 10,
+    }
+
+
+def test_derived_media_obj_from_path_video(db, tmp_path):
+    import iscc_schema as iss
+
+    metadata = {"name": "Hello", "description": "Original", "rights": "Someone"}
+    meta = iss.IsccMeta(name="New Name", creator="Me")
+    # ffmpeg only keeps the embedded tags
+    assert derived_from(tmp_path, "video", metadata, meta) == {"name": "New Name", "creator": "Me"}
+
+
+@pytest.mark.parametrize(
+    "mode,meta",
+    [
+        ("image", {"description": "Two\nlines"}),
+        ("image", {"creator": "Me"}),
+        ("video", {"name": "Back\\slash"}),
+        ("video", {"name": " Padded "}),
+        ("audio", {"name": "New Name"}),
+        ("text", {"description": "Some description"}),
+    ],
+)
+def test_derived_media_obj_from_path_extracted(db, tmp_path, monkeypatch, mode, meta):
+    import iscc_schema as iss
+    from iscc_generator import facts
+
+    monkeypatch.setattr(facts, "_extract_metadata", lambda fp: iss.IsccMeta(name="Extracted"))
+    meta = iss.IsccMeta(**meta)
+    assert derived_from(tmp_path, mode, {"name": "Hello"}, meta) == {"name": "Extracted"}
+
+
+@pytest.mark.parametrize(
+    "sample,installed",
+    [
+        (lambda: samples.images("jpg")[0], exiv2_is_installed),
+        (lambda: samples.videos("mp4")[0], lambda: is_installed(ffmpeg_bin())),
+    ],
+    ids=["image", "video"],
+)
+def test_derived_media_obj_matches_sdk(db, tmp_path, sample, installed):
+    import iscc_schema as iss
+    from iscc_generator import facts, units
+    from iscc_generator.storage import derived_media_obj_from_path, remove_local_temp
+
+    if not installed():
+        pytest.skip("metadata tools not installed")
+    source = shutil.copy(sample(), tmp_path)
+    original = models.Media.objects.create(metadata=idk.extract_metadata(source).dict())
+    meta = iss.IsccMeta(name="Embedded Name", description="Embedded", rights="Copyright Me")
+    embedded = idk.embed_metadata(source, meta)
+    try:
+        with facts.scope():
+            media_obj = derived_media_obj_from_path(embedded, original, source, meta, data=True)
+            result = units.code_iscc(embedded, media_obj.digests)
+        assert result.dict() == idk.code_iscc(embedded).dict()
+        assert known(media_obj.metadata) == known(idk.extract_metadata(embedded).dict())
+        media_obj.source_file.delete()
+    finally:
+        remove_local_temp(embedded)
+
+
+def test_derived_media_obj_incremental_data_code(db, tmp_path, monkeypatch):
+    import random
+    import string
+    import iscc_schema as iss
+    from iscc_generator.hashing import hash_file, wrap_cid
+    from iscc_generator import facts
+    from iscc_generator.storage import derived_media_obj_from_path
+
+    # metadata of embedded text files is extracted
+    monkeypatch.setattr(facts, "_extract_metadata", lambda fp: iss.IsccMeta(name="x"))
+    rnd = random.Random(0)
+    data = "".join(rnd.choices(string.ascii_letters + " \n", k=100000)).encode("ascii")
+    source = tmp_path / "source.txt"
+    source.write_bytes(data)
+    derived = tmp_path / "derived.txt"
+    derived.write_bytes(b"header " + data)
+    original = models.Media.objects.create(
+        datahash=hash_file(source.as_posix()).datahash, metadata={}
+    )
+    media_obj = derived_media_obj_from_path(
+        derived.as_posix(), original, source.as_posix(), iss.IsccMeta(name="x"), data=True
+    )
+    original.refresh_from_db()
+    assert original.chunks
+    full = hash_file(derived.as_posix(), data=True)
+    assert media_obj.digests.data_code == full.data_code
+    assert bytes(media_obj.chunks) == full.chunks
+    media_obj.refresh_from_db()
+    assert media_obj.cid_wrapped == wrap_cid(full.ipfs_root, "derived.txt")
+    media_obj.source_file.delete()
+
+
+def test_media_has_metadata(db):
+    import iscc_schema as iss
+
+    media_obj = models.Media(metadata=None)
+    assert media_obj.has_metadata(iss.IsccMeta(name="Cat")) is False
+    media_obj.metadata = {"name": "Cat", "description": "A cat", "creator": None}
+    assert media_obj.has_metadata(iss.IsccMeta(name="Cat"))
+    assert media_obj.has_metadata(iss.IsccMeta(name="Cat", description="A cat"))
+    assert not media_obj.has_metadata(iss.IsccMeta(name="Cat", creator="Me"))
+    assert not media_obj.has_metadata(iss.IsccMeta(name="Dog"))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django_q.models import Task
+from iscc_generator import notify
+
+
+def create_task(task_id):
+    now = timezone.now()
+    Task.objects.create(
+        id=task_id, name="test", func="test", started=now, stopped=now, result={"result": 1}
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_wait_for_task_timeout():
+    assert await notify.wait_for_task("0" * 32, 0.1) is None
+
+
+@pytest.mark.django_db(transaction=True)
+async def test_wait_for_task_notified(settings):
+    settings.TASK_POLL_INTERVAL = 60
+    task_id = "1" * 32
+    loop = asyncio.get_running_loop()
+    waiter = asyncio.create_task(notify.wait_for_task(task_id, 10))
+    await asyncio.sleep(0.1)
+    start = loop.time()
+    await sync_to_async(create_task)(task_id)
+    assert await waiter == {"result": 1}
+    assert loop.time() - start < 5
+
+
+async def test_get_listener_shared_and_retried(monkeypatch, settings):
+    settings.TASK_LISTEN_RETRY = 0.2
+    calls = []
+
+    class FakeListener:
+        def __init__(self, loop):
+            calls.append(loop)
+            time.sleep(0.05)
+            if len(calls) == 1:
+                raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(notify, "connection", SimpleNamespace(vendor="postgresql"))
+    monkeypatch.setattr(notify, "PgListener", FakeListener)
+    loop = asyncio.get_running_loop()
+    try:
+        assert await asyncio.gather(notify.get_listener(), notify.get_listener()) == [None, None]
+        assert len(calls) == 1
+        # failed setup is not retried before the backoff expires
+        assert await notify.get_listener() is None
+        assert len(calls) == 1
+        await asyncio.sleep(0.25)
+        first, second = await asyncio.gather(notify.get_listener(), notify.get_listener())
+        assert isinstance(first, FakeListener)
+        assert first is second
+        assert len(calls) == 2
+    finally:
+        notify._listeners.pop(loop, None)
+        notify._retry_at.pop(loop, None)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import pytest
+from iscc_generator import models, pipeline
+from iscc_generator.pipeline import Stage, StagePolicy
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    calls = []
+    failures = {Stage.EMBED: 1}
+
+    def stage_func(stage, next_stage):
+        def func(iscc_obj):
+            calls.append(stage)
+            if failures.get(stage):
+                failures[stage] -= 1
+                raise OSError("transient")
+            if next_stage == Stage.DONE:
+                iscc_obj.iscc = "ISCC:AAA"
+                iscc_obj.save(update_fields=["iscc"])
+            return next_stage
+
+        return func
+
+    order = [Stage.FETCH, Stage.EMBED, Stage.ISCC, Stage.DONE]
+    for stage, next_stage in zip(order, order[1:]):
+        policy = StagePolicy(stage_func(stage, next_stage), pipeline.IO, 60, 1, (OSError,))
+        monkeypatch.setitem(pipeline.STAGES, stage, policy)
+    return calls, failures
+
+
+def test_pipeline_stages_retry_from_checkpoint(db, stages):
+    from django_q.models import Task
+
+    calls, _ = stages
+    iscc_obj = models.IsccCode.objects.create(source_url="http://example.com/file.txt")
+    task_id = pipeline.start_pipeline(iscc_obj)
+    assert calls == [Stage.FETCH, Stage.EMBED, Stage.EMBED, Stage.ISCC]
+    iscc_obj.refresh_from_db()
+    assert iscc_obj.stage == Stage.DONE
+    assert iscc_obj.iscc == "ISCC:AAA"
+    # follow the chain of stage tasks to the final result
+    result = Task.get_result(task_id)
+    while "next" in result:
+        result = Task.get_result(result["next"])
+    assert result == {"result": "ISCC:AAA"}
+    assert Task.objects.get(id=iscc_obj.task_id).result == result
+
+
+def test_pipeline_failed_stage_resumes(db, stages):
+    calls, failures = stages
+    failures[Stage.EMBED] = 2
+    iscc_obj = models.IsccCode.objects.create(source_url="http://example.com/file.txt")
+    with pytest.raises(OSError):
+        pipeline.start_pipeline(iscc_obj)
+    iscc_obj.refresh_from_db()
+    assert iscc_obj.stage == Stage.EMBED
+    assert iscc_obj.iscc is None
+    pipeline.run_pipeline(iscc_obj.pk)
+    assert calls == [Stage.FETCH, Stage.EMBED, Stage.EMBED, Stage.EMBED, Stage.ISCC]
+    iscc_obj.refresh_from_db()
+    assert iscc_obj.stage == Stage.DONE
+
+
+def test_pipeline_result_cache_filename_name(db, tmp_path, monkeypatch):
+    import iscc_sdk as idk
+    from iscc_generator import facts, units
+    from iscc_generator.storage import media_obj_from_path
+
+    def code_iscc(fp, digests):
+        meta = units.code_meta(fp)
+        return idk.IsccMeta.construct(iscc=meta.iscc, name=meta.name)
+
+    # the file has no embedded name, the Meta-Code falls back to the filename
+    monkeypatch.setattr(facts, "_extract_metadata", lambda fp: idk.IsccMeta())
+    monkeypatch.setattr(pipeline, "code_iscc", code_iscc)
+    results = []
+    for filename in ["first-name.txt", "other-name.txt", "first-name.txt"]:
+        fp = tmp_path / filename
+        fp.write_bytes(b"hello world")
+        media_obj = media_obj_from_path(fp.as_posix(), data=True)
+        iscc_obj = models.IsccCode.objects.create(source_file=media_obj)
+        results.append(pipeline.run_pipeline(iscc_obj.pk).result)
+    assert [result["name"] for result in results] == ["first name", "other name", "first name"]
+    assert results[0]["iscc"] != results[1]["iscc"]
+    assert results[2]["iscc"] == results[0]["iscc"]
+    assert models.CacheStats.objects.get(name="result").hits == 1
+    for media_obj in models.Media.objects.all():
+        media_obj.source_file.delete()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+import pytest
+from django.utils import timezone
+from django_q.signals import pre_enqueue, pre_execute
+from iscc_generator import queues
+
+
+def test_queued_task_index(db):
+    now = timezone.now()
+    first = dict(id="a" * 32, name="first", started=now)
+    second = dict(id="b" * 32, name="second", started=now + timedelta(seconds=1))
+    pre_enqueue.send(sender="django_q", task=first)
+    pre_enqueue.send(sender="django_q", task=second)
+    assert queues.find_queued_task(second["id"]).queue_position == 2
+    pre_execute.send(sender="django_q", func=None, task=first)
+    assert queues.find_queued_task(first["id"]) is None
+    assert queues.find_queued_task(second["id"]).queue_position == 1
+
+
+LANES = {
+    "fast": dict(max_size=1024 * 1024, modes=["image", "text"], timeout=60),
+    "heavy": dict(modes=["video"], workers=1, timeout=3600),
+    "bulk": dict(),
+}
+
+
+def test_queued_task_position_per_queue(db, settings, monkeypatch):
+    from django_q.conf import Conf
+
+    def async_task(func, *args, **options):
+        task = dict(id=func * 32, name=func, started=timezone.now())
+        pre_enqueue.send(sender="django_q", task=task)
+        return task["id"]
+
+    settings.QUEUE_LANES = LANES
+    monkeypatch.setattr(queues, "async_task", async_task)
+    first = queues.find_queued_task(queues.enqueue_task("a"))
+    fast = queues.find_queued_task(queues.enqueue_task("b", lane="fast"))
+    second = queues.find_queued_task(queues.enqueue_task("c"))
+    assert (first.queue, fast.queue, second.queue) == (Conf.PREFIX, "fast", Conf.PREFIX)
+    assert [first.queue_position, fast.queue_position, second.queue_position] == [1, 1, 2]
+
+
+def test_select_lane(settings):
+    settings.QUEUE_LANES = LANES
+    assert queues.select_lane(1000, "image/png") == "fast"
+    assert queues.select_lane(2 * 1024 * 1024, "image/png") == "bulk"
+    assert queues.select_lane(2 * 1024 * 1024, "video/mp4") == "heavy"
+    assert queues.select_lane(None, "text/plain") == "bulk"
+    assert queues.select_lane(1000, "application/x-unknown") == "bulk"
+    settings.QUEUE_LANES = {}
+    assert queues.select_lane(1000, "image/png") is None
+
+
+def test_lane_options(db, settings):
+    settings.QUEUE_LANES = LANES
+    options = queues.lane_options("fast", timeout=900)
+    assert options["broker"].list_key == queues.get_queue_broker("fast").list_key
+    assert options["timeout"] == 60
+    assert queues.lane_options("bulk", timeout=900)["timeout"] == 900
+    assert "timeout" not in queues.lane_options(None)
+
+
+def test_queue_depths(settings, monkeypatch):
+    class Broker:
+        def __init__(self, list_key):
+            self.list_key = list_key
+
+        def queue_size(self):
+            return len(self.list_key)
+
+    settings.QUEUE_LANES = LANES
+    monkeypatch.setattr(queues, "get_queue_broker", Broker)
+    assert queues.queue_depths() == {"fast": 4, "heavy": 5, "bulk": 4}
+
+
+def test_lane_timeout_below_retry():
+    from pydantic import ValidationError
+    from iscc_service_generator.settings import ProjectSettings
+
+    lanes = {"heavy": dict(timeout=7200)}
+    with pytest.raises(ValidationError, match="Timeout of lane heavy"):
+        ProjectSettings(QUEUE_LANES=lanes, Q_CLUSTER={"retry": 3700})
+    assert ProjectSettings(QUEUE_LANES=lanes, Q_CLUSTER={"retry": 7300}).QUEUE_LANES == lanes
+
+
+def test_qlane_retry_above_timeout(settings, monkeypatch):
+    from django.core.management import call_command
+    from django_q.conf import Conf
+    from iscc_generator.management.commands import qlane
+
+    class Cluster:
+        def __init__(self, broker):
+            self.timeout = Conf.TIMEOUT
+
+        def start(self):
+            started.append((self.timeout, Conf.RETRY))
+
+    started = []
+    settings.QUEUE_LANES = LANES
+    monkeypatch.setattr(qlane, "Cluster", Cluster)
+    monkeypatch.setattr(Conf, "RETRY", 3700)
+    monkeypatch.setattr(Conf, "WORKERS", Conf.WORKERS)
+    call_command("qlane", "heavy")
+    assert started[-1] == (3600, 3700)
+    call_command("qlane", "heavy", "--timeout", "7200")
+    assert started[-1] == (7200, 7300)
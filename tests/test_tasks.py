@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from django.core.files.base import ContentFile
+from iscc_generator import models, tasks
+from iscc_generator.hashing import hash_file, wrap_cid
+
+
+def test_join_cid_wrapped(transactional_db, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    fp = tmp_path / "hello.txt"
+    fp.write_bytes(b"hello world")
+    expected = wrap_cid(hash_file(fp.as_posix()).ipfs_root, "hello.txt")
+    media_obj = models.Media.objects.create()
+    media_obj.source_file.save("hello.txt", ContentFile(b"hello world"))
+    assert media_obj.cid_wrapped is None
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(tasks.media_cid_wrapped_thread, media_obj)
+        assert tasks.join_cid_wrapped(media_obj, {media_obj.pk: future}) == expected
+    assert models.Media.objects.get(pk=media_obj.pk).cid_wrapped == expected
+    media_obj.source_file.delete()
+
+
+def test_nft_generator_task_wrapped_cids(transactional_db):
+    from constance import config
+
+    image = models.Media.objects.create()
+    image.source_file.save("image.txt", ContentFile(b"an image"))
+    animation = models.Media.objects.create()
+    animation.source_file.save("animation.txt", ContentFile(b"an animation"))
+    models.IsccCode.objects.create(
+        source_file=animation, iscc="ISCC:AAA", result={"iscc": "ISCC:AAA"}
+    )
+    nft_obj = models.Nft.objects.create(media_id_image=image, media_id_animation=animation)
+    ipfs_wrap, config.IPFS_WRAP = config.IPFS_WRAP, True
+    try:
+        tasks.nft_generator_task(nft_obj.pk)
+    finally:
+        config.IPFS_WRAP = ipfs_wrap
+    nft_obj.refresh_from_db()
+    metadata = nft_obj.result["nft_metadata"]
+    for media_obj, field in [(image, "image"), (animation, "animation_url")]:
+        media_obj.refresh_from_db()
+        assert media_obj.cid_wrapped.endswith(f"/{media_obj.filename}")
+        assert metadata[field] == f"ipfs://{media_obj.cid_wrapped}"
+        media_obj.source_file.delete()
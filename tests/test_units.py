@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import shutil
+import iscc_samples as samples
+import iscc_sdk as idk
+import pytest
+from iscc_sdk.tools import exiv2_is_installed
+from iscc_generator import facts, hashing, units
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    """Same extracted metadata for the sdk and `facts`."""
+    meta = dict(name="The Name", description="Some description")
+
+    def extract(fp):
+        return idk.IsccMeta.construct(**meta)
+
+    monkeypatch.setattr(idk, "extract_metadata", extract)
+    monkeypatch.setattr(facts, "_extract_metadata", extract)
+    return meta
+
+
+def test_code_meta_matches_sdk(tmp_path, extracted):
+    fp = tmp_path / "hello-world.txt"
+    fp.write_text("hello world")
+    assert units.code_meta(fp.as_posix()).dict() == idk.code_meta(fp.as_posix()).dict()
+    extracted.clear()
+    assert units.code_meta(fp.as_posix()).dict() == idk.code_meta(fp.as_posix()).dict()
+
+
+@pytest.mark.skipif(not exiv2_is_installed(), reason="exiv2 not installed")
+def test_code_iscc_matches_sdk(tmp_path, extracted):
+    fp = shutil.copy(samples.images("jpg")[0], tmp_path)
+    digests = hashing.hash_file(fp, data=True)
+    assert units.code_iscc(fp, digests).dict() == idk.code_iscc(fp).dict()
@@ -13,7 +13,7 @@ def test_normalize_web3_address():
     assert norm.wallet == "0xb794F5eA0ba39494cE839613fffBA74279579268"
 
 
-def test_forecast_iscc_id_local():
+def test_forecast_iscc_id_local(db):
     code = "ISCC:KACT4EBWK27737D2AYCJRAL5Z36G76RFRMO4554RU26HZ4ORJGIVHDI"
     chain = "BITCOIN"
     wallet = "1Bq568oLhi5HvdgC6rcBSGmu4G3FeAntCz"
@@ -21,7 +21,7 @@ def test_forecast_iscc_id_local():
     assert iid == "ISCC:MEAJU5AXCPOIOYFL"
 
 
-def test_forecast_iscc_id_remote(use_forecast_url):
+def test_forecast_iscc_id_remote(db, use_forecast_url):
     code = "ISCC:KACT4EBWK27737D2AYCJRAL5Z36G76RFRMO4554RU26HZ4ORJGIVHDI"
     chain = "ETHEREUM"
     wallet = "0xa2fFD293145d89D61b39a2842F35a52E89a317f5"